@@ -4,14 +4,25 @@ from dataclasses import dataclass
 from dotenv import load_dotenv
 import logfire
 import httpx
+import asyncio
 import os
-from typing import List
+from typing import Dict, List, Optional
 
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from openai import AsyncAzureOpenAI # We need this to create our client
 from supabase import Client
 
+from embedding_cache import query_embedding_cache_from_env
+from retrieval_cache import IndexVersionTracker, SemanticRetrievalCache
+from hybrid_search import HybridSearchConfig, fetch_chunk_embeddings, fetch_chunk_windows, hybrid_search
+from ann_index import site_pages_mirror_from_env
+from page_catalog import VersionedLRUCache
+from data_access import supabase_executor
+from context_packer import PackingConfig, merge_adjacent, merge_windows, mmr_select, pack_sections, window_sections
+from multi_query import expand_query, extract_identifiers, fuse_query_results
+from prefetch import RetrievalPrefetcher
+
 load_dotenv()
 
 # --- Azure OpenAI Configuration ---
@@ -44,14 +55,97 @@ model.client = azure_client
 
 logfire.configure(send_to_logfire='if-token-present')
 
+# Query embeddings are cached so repeated questions skip the embeddings API round trip
+query_embedding_cache = query_embedding_cache_from_env()
+
+async def get_query_embedding(user_query: str) -> List[float]:
+    """Embed a query, reusing cached embeddings for the same normalized text and deployment."""
+    async def embed(text: str) -> List[float]:
+        embedding_response = await azure_client.embeddings.create(
+            model=EMBEDDING_DEPLOYMENT_NAME,
+            input=text
+        )
+        return embedding_response.data[0].embedding
+
+    embedding = await query_embedding_cache.get_or_create(user_query, EMBEDDING_DEPLOYMENT_NAME, embed)
+    logfire.debug('query embedding cache', **query_embedding_cache.stats())
+    return embedding
+
+async def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """Embed several queries, sending every cache miss in one batched embeddings request."""
+    async def embed_many(texts: List[str]) -> List[List[float]]:
+        embedding_response = await azure_client.embeddings.create(
+            model=EMBEDDING_DEPLOYMENT_NAME,
+            input=texts
+        )
+        return [item.embedding for item in sorted(embedding_response.data, key=lambda item: item.index)]
+
+    embeddings = await query_embedding_cache.get_or_create_many(queries, EMBEDDING_DEPLOYMENT_NAME, embed_many)
+    logfire.debug('query embedding cache', **query_embedding_cache.stats())
+    return embeddings
+
+# Near-duplicate questions reuse an earlier chunk set until the next re-ingest
+retrieval_cache = SemanticRetrievalCache(
+    similarity_threshold=float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.95")),
+    max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600")),
+)
+index_version_tracker = IndexVersionTracker(
+    check_interval_seconds=float(os.getenv("INDEX_VERSION_CHECK_SECONDS", "30"))
+)
+
+def fetch_index_version(supabase: Client, source: str = 'pydantic_ai_docs') -> int:
+    result = supabase.from_('site_pages_index').select('version').eq('source', source).execute()
+    return result.data[0]['version'] if result.data else 0
+
+# Lexical and vector results are fused so exact API names and error strings are found too
+hybrid_search_config = HybridSearchConfig.from_env()
+
+# Optional in-process copy of the vector index (ANN_MIRROR_ENABLED); the RPC is used until it is loaded
+site_pages_mirror = site_pages_mirror_from_env()
+
+def start_site_pages_mirror(supabase: Client):
+    """Start loading and polling the in-process mirror; safe to call on every Streamlit rerun."""
+    if site_pages_mirror is not None:
+        site_pages_mirror.start_polling(
+            supabase,
+            lambda: index_version_tracker.current(lambda: fetch_index_version(supabase)),
+            interval_seconds=float(os.getenv("ANN_REFRESH_SECONDS", "60"))
+        )
+
+# The page list and assembled page bodies are reused until the next re-ingest
+page_cache = VersionedLRUCache(max_entries=int(os.getenv("PAGE_CACHE_SIZE", "128")))
+
+async def current_index_version(supabase: Client):
+    return await index_version_tracker.current_async(lambda: supabase_executor.call(fetch_index_version, supabase))
+
+# Retrieved chunks are over-fetched, diversified with MMR and trimmed to a token budget
+packing_config = PackingConfig.from_env()
+
+async def load_chunk_embeddings(supabase: Client, ids: List[int]) -> Dict[int, List[float]]:
+    """Embeddings for MMR: from the in-process mirror when loaded, otherwise one batched query."""
+    embeddings = site_pages_mirror.embeddings_for(ids) if site_pages_mirror is not None else {}
+    missing = [chunk_id for chunk_id in ids if chunk_id not in embeddings]
+    if missing:
+        try:
+            embeddings.update(await supabase_executor.call(fetch_chunk_embeddings, supabase, missing))
+        except Exception as e:
+            print(f"Error fetching chunk embeddings, packing by relevance only: {e}")
+    return embeddings
+
 # Dependencies are simplified as the client is now part of the context
 @dataclass
 class PydanticAIDeps:
     supabase: Client
+    # Set by the UI when retrieval for the user's question was started speculatively
+    prefetcher: Optional[RetrievalPrefetcher] = None
+    # Set by the batch runner to record the ids of the chunks that reached the model
+    retrieved_chunk_ids: Optional[List[int]] = None
 
 system_prompt = """
 You are an expert at Google ADK - a Google ADK agent framework. Your job is to assist with questions about it.
 You must use the provided tools to look at the documentation before answering. Always start with RAG.
+When a question has several parts, retrieve them together with retrieve_documentation_multi.
 """
 
 pydantic_ai_expert = Agent(
@@ -61,46 +155,166 @@ pydantic_ai_expert = Agent(
     retries=2
 )
 
-# The tool correctly uses ctx.client, which will now be our azure_client
+async def search_chunks(
+    supabase: Client, user_query: str, query_embedding: List[float], path_prefix: Optional[str] = None
+) -> List[Dict]:
+    """Fused candidate chunks for one query, served from the semantic cache when possible."""
+    index_version = await current_index_version(supabase)
+    identifiers = extract_identifiers(user_query)
+    chunks = retrieval_cache.lookup(query_embedding, index_version, params=path_prefix or "", identifiers=identifiers)
+    if chunks is None:
+        chunks = await hybrid_search(
+            supabase,
+            user_query,
+            query_embedding,
+            hybrid_search_config,
+            filter={'source': 'pydantic_ai_docs'},
+            mirror=site_pages_mirror,
+            limit=packing_config.candidate_count,
+            path_prefix=path_prefix
+        )
+        retrieval_cache.store(query_embedding, index_version, chunks, params=path_prefix or "", identifiers=identifiers)
+    return chunks
+
+MAX_NEIGHBOR_CHUNKS = 3
+
+async def build_context(
+    supabase: Client,
+    query_embedding: List[float],
+    chunks: List[Dict],
+    neighbors: int = 0,
+    retrieved_chunk_ids: Optional[List[int]] = None,
+) -> str:
+    """Pack candidate chunks, optionally widened to +-`neighbors` chunks, into the text returned to the model."""
+    embeddings = await load_chunk_embeddings(supabase, [doc['id'] for doc in chunks])
+    selected = mmr_select(query_embedding, chunks, embeddings, packing_config.max_chunks, packing_config.mmr_lambda)
+    if retrieved_chunk_ids is not None:
+        retrieved_chunk_ids.extend(doc['id'] for doc in selected)
+    sections = merge_adjacent(selected)
+    if neighbors > 0:
+        windows = merge_windows(selected, min(neighbors, MAX_NEIGHBOR_CHUNKS))
+        try:
+            rows = await supabase_executor.call(fetch_chunk_windows, supabase, windows, {'source': 'pydantic_ai_docs'})
+            sections = window_sections(windows, rows, packing_config.token_budget) or sections
+        except Exception as e:
+            print(f"Error fetching neighbouring chunks, using hits only: {e}")
+    context, stats = pack_sections(
+        sections, chunks, len(selected), packing_config, baseline_count=hybrid_search_config.match_count
+    )
+    logfire.info(
+        'packed retrieval context: {tokens} tokens, saved {tokens_saved}',
+        tokens=stats.tokens,
+        tokens_saved=stats.tokens_saved,
+        candidates=stats.candidates,
+        sections=stats.sections,
+    )
+    return context
+
+def start_prefetch(deps: PydanticAIDeps, user_input: str):
+    """Start retrieving for the user's question now, so a matching tool call can reuse it."""
+    if deps.prefetcher is not None:
+        deps.prefetcher.start(
+            user_input,
+            get_query_embedding,
+            lambda query, embedding: search_chunks(deps.supabase, query, embedding)
+        )
+
+# The tools embed through get_query_embedding(s), which use our azure_client behind a cache
 @pydantic_ai_expert.tool
-async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_query: str) -> str:
+async def retrieve_relevant_documentation(
+    ctx: RunContext[PydanticAIDeps], user_query: str, neighbors: int = 0, path_prefix: str = ""
+) -> str:
     """
     Retrieve relevant documentation chunks based on the query with RAG.
+
+    Args:
+        user_query: The question or search terms.
+        neighbors: Also include this many chunks before and after each hit (0-3). Use it when a
+            hit cuts off mid-explanation instead of fetching the whole page.
+        path_prefix: Only search pages whose URL path starts with this, e.g. a docs section
+            like "/adk-docs/tools/". Leave empty to search everything.
     """
     try:
-        embedding_response = await ctx.client.embeddings.create(
-            model=EMBEDDING_DEPLOYMENT_NAME,
-            input=user_query
-        )
-        query_embedding = embedding_response.data[0].embedding
-        
-        result = ctx.deps.supabase.rpc(
-            'match_site_pages',
-            {
-                'query_embedding': query_embedding,
-                'match_count': 5,
-                'filter': {'source': 'pydantic_ai_docs'}
-            }
-        ).execute()
+        query_embedding = await get_query_embedding(user_query)
+        chunks = None
+        # The prefetch searched without a path filter, so it only stands in for unfiltered calls
+        if ctx.deps.prefetcher is not None and not path_prefix:
+            chunks = await ctx.deps.prefetcher.lookup(query_embedding)
+        if chunks is None:
+            chunks = await search_chunks(ctx.deps.supabase, user_query, query_embedding, path_prefix)
         
-        if not result.data:
+        if not chunks:
             return "No relevant documentation found."
             
-        formatted_chunks = [f"# {doc['title']}\n\n{doc['content']}" for doc in result.data]
-        return "\n\n---\n\n".join(formatted_chunks)
+        return await build_context(
+            ctx.deps.supabase, query_embedding, chunks, neighbors or packing_config.neighbor_chunks,
+            retrieved_chunk_ids=ctx.deps.retrieved_chunk_ids
+        )
         
     except Exception as e:
         print(f"Error retrieving documentation: {e}")
         return f"Error retrieving documentation: {str(e)}"
 
+@pydantic_ai_expert.tool
+async def retrieve_documentation_multi(ctx: RunContext[PydanticAIDeps], queries: List[str], path_prefix: str = "") -> str:
+    """
+    Retrieve documentation for several related sub-queries in one call, e.g. the
+    separate parts of a complex question. Prefer this over several sequential
+    retrieve_relevant_documentation calls. A single query is expanded automatically.
+    `path_prefix` limits every sub-query to pages whose URL path starts with it.
+    """
+    try:
+        if len(queries) == 1:
+            queries = expand_query(queries[0])
+        queries = [query for query in queries if query.strip()]
+        if not queries:
+            return "No queries provided."
+
+        query_embeddings = await get_query_embeddings(queries)
+        results = await asyncio.gather(*[
+            search_chunks(ctx.deps.supabase, query, embedding, path_prefix)
+            for query, embedding in zip(queries, query_embeddings)
+        ])
+        chunks = fuse_query_results(list(results), k=hybrid_search_config.rrf_k, limit=packing_config.candidate_count)
+
+        if not chunks:
+            return "No relevant documentation found."
+
+        # MMR relevance comes from the fused scores; the mean query only matters as a fallback
+        mean_embedding = [sum(values) / len(values) for values in zip(*query_embeddings)]
+        return await build_context(
+            ctx.deps.supabase, mean_embedding, chunks, retrieved_chunk_ids=ctx.deps.retrieved_chunk_ids
+        )
+
+    except Exception as e:
+        print(f"Error retrieving documentation: {e}")
+        return f"Error retrieving documentation: {str(e)}"
+
 # ... (The rest of the tools are unchanged and correct) ...
 
 @pydantic_ai_expert.tool
-async def list_documentation_pages(ctx: RunContext[PydanticAIDeps]) -> List[str]:
+async def list_documentation_pages(ctx: RunContext[PydanticAIDeps], path_prefix: str = "") -> List[str]:
+    """List documentation page URLs, optionally only those whose URL path starts with `path_prefix`."""
     try:
-        result = ctx.deps.supabase.from_('site_pages').select('url').eq('metadata->>source', 'pydantic_ai_docs').execute()
-        if not result.data: return []
-        return sorted(set(doc['url'] for doc in result.data))
+        index_version = await current_index_version(ctx.deps.supabase)
+        pages = page_cache.get(('catalog', 'pydantic_ai_docs', path_prefix), index_version)
+        if pages is not None: return pages
+        query = ctx.deps.supabase.from_('site_page_catalog').select('url').eq('source', 'pydantic_ai_docs')
+        if path_prefix:
+            query = query.like('url_path', f'{path_prefix}%')
+        result = await supabase_executor.execute(query.order('url'))
+        if result.data:
+            pages = [doc['url'] for doc in result.data]
+        else:
+            # Catalog not populated yet: fall back to deduplicating chunk urls
+            query = ctx.deps.supabase.from_('site_pages').select('url').eq('source', 'pydantic_ai_docs')
+            if path_prefix:
+                query = query.like('url_path', f'{path_prefix}%')
+            result = await supabase_executor.execute(query)
+            if not result.data: return []
+            pages = sorted(set(doc['url'] for doc in result.data))
+        page_cache.set(('catalog', 'pydantic_ai_docs', path_prefix), index_version, pages)
+        return pages
     except Exception as e:
         print(f"Error listing pages: {e}")
         return []
@@ -108,11 +322,18 @@ async def list_documentation_pages(ctx: RunContext[PydanticAIDeps]) -> List[str]
 @pydantic_ai_expert.tool
 async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str) -> str:
     try:
-        result = ctx.deps.supabase.from_('site_pages').select('title, content, chunk_number').eq('url', url).eq('metadata->>source', 'pydantic_ai_docs').order('chunk_number').execute()
+        index_version = await current_index_version(ctx.deps.supabase)
+        page = page_cache.get(('page', url), index_version)
+        if page is not None: return page
+        result = await supabase_executor.execute(
+            ctx.deps.supabase.from_('site_pages').select('title, content, chunk_number').eq('url', url).eq('source', 'pydantic_ai_docs').order('chunk_number')
+        )
         if not result.data: return f"No content found for URL: {url}"
         page_title = result.data[0]['title'].split(' - ')[0]
         content = "\n\n".join(chunk['content'] for chunk in result.data)
-        return f"# {page_title}\n\n{content}"
+        page = f"# {page_title}\n\n{content}"
+        page_cache.set(('page', url), index_version, page)
+        return page
     except Exception as e:
         print(f"Error getting page content: {e}")
-        return f"Error: {str(e)}"
\ No newline at end of file
+        return f"Error: {str(e)}"
@@ -0,0 +1,323 @@
+# pyright: reportMissingImports=false
+"""In-process nearest-neighbour mirror of site_pages so vector search skips the Supabase RPC."""
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from supabase import Client
+
+try:
+    import hnswlib
+except ImportError:  # optional: fall back to exact search over the normalized matrix
+    hnswlib = None
+
+ROW_COLUMNS = 'id, url, url_path, chunk_number, title, summary, content, metadata, crawled_at'
+
+
+def _parse_embedding(value) -> List[float]:
+    # PostgREST returns pgvector columns as their text form, e.g. "[0.1,0.2,...]"
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def _matches(row: Dict[str, Any], filter: Dict[str, Any], path_prefix: Optional[str]) -> bool:
+    if path_prefix:
+        # Snapshots written before the url_path column existed only have it in metadata
+        url_path = row.get('url_path') or row['metadata'].get('url_path', '')
+        if not url_path.startswith(path_prefix):
+            return False
+    return all(row['metadata'].get(key) == value for key, value in filter.items())
+
+
+class SitePagesMirror:
+    """
+    Keeps every chunk of one source in memory with an HNSW index (hnswlib when
+    installed, exact numpy search otherwise).
+
+    The mirror is rebuilt when the index version changes (a re-ingest) and is
+    otherwise refreshed incrementally: rows with ids above the highest one seen
+    are added, and rows re-crawled since the newest `crawled_at` seen replace
+    their old copy. A snapshot directory lets restarts load the mirror (the
+    embedding matrix memory-mapped, the HNSW graph as saved) instead of
+    downloading every embedding and rebuilding the index.
+    """
+
+    def __init__(self, source: str = 'pydantic_ai_docs', snapshot_dir: Optional[str] = None, page_size: int = 500):
+        self.source = source
+        self.snapshot_dir = snapshot_dir
+        self.page_size = page_size
+        self.index_version: Optional[int] = None
+        self.max_id = 0
+        # (crawled_at, id) of the most recently crawled row seen
+        self.watermark: Tuple[str, int] = ('', 0)
+        self._rows: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._hnsw = None
+        self._positions: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return len(self._rows) > 0
+
+    def _reset(self):
+        self.max_id = 0
+        self.watermark = ('', 0)
+        self._rows = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._hnsw = None
+        self._positions = {}
+
+    def _add(self, rows: List[Dict[str, Any]], embeddings: np.ndarray, normalized: bool = False, indexed: bool = False):
+        """Append rows; with `indexed`, they are already in `self._hnsw` (loaded from a snapshot)."""
+        if not normalized:
+            embeddings = _normalize(embeddings)
+        start = len(self._rows)
+        self._matrix = embeddings if start == 0 else np.vstack([self._matrix, embeddings])
+        self._positions.update((row['id'], start + offset) for offset, row in enumerate(rows))
+        self._rows.extend(rows)
+        self.max_id = max([self.max_id] + [row['id'] for row in rows])
+        self._advance_watermark(rows)
+
+        if hnswlib is not None and not indexed:
+            if self._hnsw is None:
+                self._hnsw = hnswlib.Index(space='cosine', dim=embeddings.shape[1])
+                self._hnsw.init_index(max_elements=max(1024, 2 * len(self._rows)), ef_construction=200, M=16)
+                self._hnsw.set_ef(64)
+                embeddings, start = self._matrix, 0
+            elif self._hnsw.get_max_elements() < len(self._rows):
+                self._hnsw.resize_index(2 * len(self._rows))
+            self._hnsw.add_items(embeddings, np.arange(start, start + len(embeddings)))
+
+    def _advance_watermark(self, rows: List[Dict[str, Any]]):
+        self.watermark = max([self.watermark] + [(row.get('crawled_at') or '', row['id']) for row in rows])
+
+    def _replace(self, rows: List[Dict[str, Any]], embeddings: np.ndarray):
+        """Update rows already in the mirror in place, keeping their positions (and HNSW labels)."""
+        embeddings = _normalize(embeddings)
+        positions = [self._positions[row['id']] for row in rows]
+        if not self._matrix.flags.writeable:
+            # Copy a matrix memory-mapped from the snapshot before writing to it
+            self._matrix = np.array(self._matrix)
+        self._matrix[positions] = embeddings
+        for position, row in zip(positions, rows):
+            self._rows[position] = row
+        self._advance_watermark(rows)
+        if self._hnsw is not None:
+            # hnswlib updates the vector of a label that is already in the index
+            self._hnsw.add_items(embeddings, np.asarray(positions))
+
+    def _pull_updated(self, supabase: Client) -> int:
+        """Fetch rows crawled again since the watermark and replace their old copies; returns rows updated."""
+        updated = 0
+        while self.watermark[0]:
+            crawled_at, last_id = self.watermark
+            # Keyset pagination on (crawled_at, id), so rows sharing a timestamp aren't skipped
+            result = supabase.from_('site_pages') \
+                .select(f'{ROW_COLUMNS}, embedding') \
+                .eq('source', self.source) \
+                .or_(f'crawled_at.gt."{crawled_at}",and(crawled_at.eq."{crawled_at}",id.gt.{last_id})') \
+                .order('crawled_at') \
+                .order('id') \
+                .limit(self.page_size) \
+                .execute()
+            if not result.data:
+                break
+            embeddings = np.asarray([_parse_embedding(row.pop('embedding')) for row in result.data], dtype=np.float32)
+            with self._lock:
+                known = [i for i, row in enumerate(result.data) if row['id'] in self._positions]
+                new = [i for i, row in enumerate(result.data) if row['id'] not in self._positions]
+                if known:
+                    self._replace([result.data[i] for i in known], embeddings[known])
+                if new:
+                    self._add([result.data[i] for i in new], embeddings[new])
+            updated += len(result.data)
+            if len(result.data) < self.page_size:
+                break
+        return updated
+
+    def _pull(self, supabase: Client) -> int:
+        added = 0
+        while True:
+            result = supabase.from_('site_pages') \
+                .select(f'{ROW_COLUMNS}, embedding') \
+                .eq('source', self.source) \
+                .gt('id', self.max_id) \
+                .order('id') \
+                .limit(self.page_size) \
+                .execute()
+            if not result.data:
+                break
+            embeddings = np.asarray([_parse_embedding(row.pop('embedding')) for row in result.data], dtype=np.float32)
+            with self._lock:
+                self._add(result.data, embeddings)
+            added += len(result.data)
+            if len(result.data) < self.page_size:
+                break
+        return added
+
+    def refresh(self, supabase: Client, index_version: Optional[int]) -> int:
+        """
+        Pull rows added or re-crawled since the last refresh (everything after a
+        version change); returns the number of rows added or updated.
+        """
+        # An unknown version (lookup failed) keeps the mirror and just polls for new rows
+        if index_version is not None and index_version != self.index_version:
+            # Rebuild on the side so searches keep using the old mirror until the new one is complete
+            rebuilt = SitePagesMirror(self.source, page_size=self.page_size)
+            added = rebuilt._pull(supabase)
+            with self._lock:
+                self.index_version = index_version
+                self.max_id, self.watermark, self._rows, self._matrix, self._hnsw, self._positions = (
+                    rebuilt.max_id, rebuilt.watermark, rebuilt._rows, rebuilt._matrix, rebuilt._hnsw, rebuilt._positions
+                )
+        else:
+            # New rows first, so they move the watermark and aren't fetched again as updates
+            added = self._pull(supabase)
+            added += self._pull_updated(supabase)
+
+        if added and self.snapshot_dir:
+            self.save_snapshot()
+        return added
+
+    def search(
+        self,
+        query_embedding: List[float],
+        match_count: int,
+        filter: Optional[Dict[str, Any]] = None,
+        path_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the closest chunks with a `similarity` score, in the same shape as match_site_pages."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        filter = filter or {}
+        with self._lock:
+            if not self._rows:
+                return []
+            if filter or path_prefix:
+                # Exact search over just the matching rows, so a narrow section or filter
+                # still gets match_count results instead of whatever survives a global top-k
+                positions = np.asarray(
+                    [position for position, row in enumerate(self._rows) if _matches(row, filter, path_prefix)],
+                    dtype=np.int64,
+                )
+                if len(positions) == 0:
+                    return []
+                similarities = np.asarray(self._matrix[positions] @ query)
+                k = min(len(positions), match_count)
+                top = np.argpartition(-similarities, k - 1)[:k]
+                top = top[np.argsort(-similarities[top])]
+                hits = zip(positions[top], similarities[top])
+            elif self._hnsw is not None:
+                k = min(len(self._rows), match_count)
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                hits = zip(labels[0], 1 - distances[0])
+            else:
+                k = min(len(self._rows), match_count)
+                similarities = self._matrix @ query
+                top = np.argpartition(-similarities, k - 1)[:k]
+                top = top[np.argsort(-similarities[top])]
+                hits = zip(top, similarities[top])
+            return [{**self._rows[int(position)], 'similarity': float(similarity)} for position, similarity in hits]
+
+    def embeddings_for(self, ids: List[int]) -> Dict[int, np.ndarray]:
+        """Normalized embeddings of the given chunk ids that are in the mirror."""
+        with self._lock:
+            return {chunk_id: self._matrix[self._positions[chunk_id]] for chunk_id in ids if chunk_id in self._positions}
+
+    def save_snapshot(self):
+        with self._lock:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            # Write then rename, so a matrix still memory-mapped from the old file stays valid
+            matrix_path = os.path.join(self.snapshot_dir, 'embeddings.npy')
+            with open(matrix_path + '.tmp', 'wb') as f:
+                np.save(f, self._matrix)
+            os.replace(matrix_path + '.tmp', matrix_path)
+            if self._hnsw is not None:
+                hnsw_path = os.path.join(self.snapshot_dir, 'hnsw.bin')
+                self._hnsw.save_index(hnsw_path + '.tmp')
+                os.replace(hnsw_path + '.tmp', hnsw_path)
+            rows_path = os.path.join(self.snapshot_dir, 'rows.json')
+            with open(rows_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'index_version': self.index_version, 'source': self.source, 'rows': self._rows}, f)
+            os.replace(rows_path + '.tmp', rows_path)
+
+    def load_snapshot(self) -> bool:
+        """Load a previous snapshot, memory-mapping the embedding matrix; returns False if there is none."""
+        rows_path = os.path.join(self.snapshot_dir or '', 'rows.json')
+        matrix_path = os.path.join(self.snapshot_dir or '', 'embeddings.npy')
+        if not self.snapshot_dir or not os.path.exists(rows_path) or not os.path.exists(matrix_path):
+            return False
+        try:
+            with open(rows_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode='r')
+            if snapshot['source'] != self.source or len(snapshot['rows']) != len(matrix):
+                return False
+            hnsw = self._load_hnsw(len(matrix), matrix.shape[1]) if len(matrix) else None
+            with self._lock:
+                self._reset()
+                self.index_version = snapshot['index_version']
+                self._hnsw = hnsw
+                if snapshot['rows']:
+                    self._add(snapshot['rows'], matrix, normalized=True, indexed=hnsw is not None)
+            return True
+        except Exception as e:
+            print(f"Error loading ANN snapshot: {e}")
+            return False
+
+    def _load_hnsw(self, count: int, dim: int):
+        """The saved HNSW graph if it matches a snapshot of `count` rows, else None (rebuilt from the matrix)."""
+        path = os.path.join(self.snapshot_dir, 'hnsw.bin')
+        if hnswlib is None or not os.path.exists(path):
+            return None
+        try:
+            index = hnswlib.Index(space='cosine', dim=dim)
+            index.load_index(path, max_elements=max(1024, 2 * count))
+            if index.get_current_count() != count:
+                return None
+            index.set_ef(64)
+            return index
+        except Exception as e:
+            print(f"Error loading HNSW snapshot, rebuilding: {e}")
+            return None
+
+    def start_polling(self, supabase: Client, fetch_index_version: Callable[[], Optional[int]], interval_seconds: float = 60):
+        """
+        In a daemon thread, load the snapshot and then refresh every `interval_seconds`
+        (no-op if already running). Searches use the remote RPC until the mirror is loaded.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def poll():
+            self.load_snapshot()
+            while not self._stop.is_set():
+                try:
+                    added = self.refresh(supabase, fetch_index_version())
+                    if added:
+                        print(f"ANN mirror added {added} rows ({len(self._rows)} total)")
+                except Exception as e:
+                    print(f"Error refreshing ANN mirror: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=poll, name='site-pages-mirror', daemon=True)
+        self._thread.start()
+
+    def stop_polling(self):
+        self._stop.set()
+
+
+def site_pages_mirror_from_env() -> Optional[SitePagesMirror]:
+    if os.getenv("ANN_MIRROR_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return SitePagesMirror(snapshot_dir=os.getenv("ANN_SNAPSHOT_DIR") or None)
@@ -0,0 +1,142 @@
+"""
+Batch question answering with pydantic_ai_expert.
+
+Reads questions from a JSONL file, runs them concurrently with a bounded
+number of workers and writes one JSON line per question with the answer, the
+ids of the chunks retrieved for it, token usage and latency. All questions
+share the process-wide embedding and retrieval caches, the Azure OpenAI HTTP
+connection pool and the Supabase client.
+
+    python batch_qa.py faq.jsonl --output answers.jsonl --concurrency 8
+
+Each input line is {"id": ..., "question": "..."}; "id" defaults to the line number.
+With --resume, questions whose id is already in the output file are skipped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Set
+
+import logfire
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+from ai_expert import (
+    PydanticAIDeps,
+    azure_client,
+    pydantic_ai_expert,
+    query_embedding_cache,
+    retrieval_cache,
+    start_prefetch,
+    start_site_pages_mirror,
+)
+from prefetch import RetrievalPrefetcher
+
+load_dotenv()
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    questions = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append({'id': item.get('id', line_number), 'question': item['question']})
+    return questions
+
+
+def answered_ids(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {str(json.loads(line)['id']) for line in f if line.strip()}
+
+
+async def answer_question(supabase: Client, item: Dict[str, Any]) -> Dict[str, Any]:
+    deps = PydanticAIDeps(
+        supabase=supabase,
+        prefetcher=RetrievalPrefetcher(similarity_threshold=float(os.getenv("PREFETCH_SIMILARITY", "0.9"))),
+        retrieved_chunk_ids=[],
+    )
+    record = {'id': item['id'], 'question': item['question']}
+    start = time.perf_counter()
+    try:
+        start_prefetch(deps, item['question'])
+        result = await pydantic_ai_expert.run(item['question'], deps=deps)
+        usage = result.usage()
+        record.update({
+            'answer': result.data,
+            'chunk_ids': list(dict.fromkeys(deps.retrieved_chunk_ids)),
+            'request_tokens': usage.request_tokens,
+            'response_tokens': usage.response_tokens,
+            'total_tokens': usage.total_tokens,
+        })
+    except Exception as e:
+        print(f"Error answering question {item['id']}: {e}")
+        record.update({'answer': None, 'chunk_ids': list(dict.fromkeys(deps.retrieved_chunk_ids)), 'error': str(e)})
+    finally:
+        deps.prefetcher.cancel()
+    record['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+async def run_batch(supabase: Client, questions: List[Dict[str, Any]], output_path: str, concurrency: int) -> List[Dict[str, Any]]:
+    """Answer every question with `concurrency` workers, appending results as they finish."""
+    pending = iter(questions)
+    records = []
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        async def worker():
+            for item in pending:
+                record = await answer_question(supabase, item)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                records.append(record)
+                print(f"[{len(records)}/{len(questions)}] {item['id']}: {record['latency_ms']:.0f} ms")
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(min(concurrency, len(questions)))])
+        finally:
+            await azure_client.close()
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('questions', help='JSONL file of questions')
+    parser.add_argument('--output', default='answers.jsonl', help='JSONL file to append answers to')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv("BATCH_CONCURRENCY", "8")), help='Agent runs in flight')
+    parser.add_argument('--resume', action='store_true', help='Skip questions already answered in the output file')
+    args = parser.parse_args()
+    logfire.configure(send_to_logfire='never', console=False)
+
+    questions = read_questions(args.questions)
+    if args.resume:
+        done = answered_ids(args.output)
+        questions = [item for item in questions if str(item['id']) not in done]
+    elif os.path.exists(args.output):
+        open(args.output, 'w').close()
+    if not questions:
+        print("No questions to answer.")
+        return
+
+    supabase: Client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    start_site_pages_mirror(supabase)
+
+    start = time.perf_counter()
+    records = asyncio.run(run_batch(supabase, questions, args.output, args.concurrency))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(1 for record in records if record.get('error'))
+    latencies = sorted(record['latency_ms'] for record in records)
+    print(f"Answered {len(records) - errors}/{len(records)} questions in {elapsed:.1f}s "
+          f"(p50 {latencies[len(latencies) // 2]:.0f} ms, max {latencies[-1]:.0f} ms)")
+    print(f"Embedding cache: {query_embedding_cache.stats()}")
+    print(f"Retrieval cache: {retrieval_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Retrieval quality and latency benchmark for the pydantic_ai_expert RAG tools.
+
+Runs retrieve_relevant_documentation against an in-memory stand-in for the
+Supabase vector store, over a synthetic corpus or a recorded one, and reports
+recall@k, MRR, p50/p99 latency and tokens returned. Results are written as
+JSON so runs can be compared across commits.
+
+    python benchmark_retrieval.py
+    python benchmark_retrieval.py --corpus recorded.json --output results.json
+
+A recorded corpus is JSON of the form:
+    {"chunks": [{"id", "url", "chunk_number", "title", "summary", "content"}, ...],
+     "queries": [{"query": "...", "relevant_ids": [1, 2]}, ...]}
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from urllib.parse import urlparse
+
+import logfire
+import numpy as np
+
+for name, value in {
+    "OPENAI_API_KEY": "benchmark",
+    "CHAT_AZURE_OPENAI_ENDPOINT": "https://benchmark.openai.azure.com",
+    "CHAT_AZURE_OPENAI_API_KEY": "benchmark",
+    "MODEL_DEPLOYMENT_NAME": "benchmark-model",
+    "EMBEDDING_DEPLOYMENT_NAME": "benchmark-embedding",
+}.items():
+    os.environ.setdefault(name, value)
+
+import ai_expert
+from page_catalog import VersionedLRUCache
+from retrieval_cache import SemanticRetrievalCache
+from tokens import count_tokens
+
+EMBEDDING_DIM = 1536
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def hash_embedding(text: str) -> List[float]:
+    """Deterministic bag-of-words embedding (hashing trick) so no embeddings API is needed."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in tokenize(text):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class LocalQuery:
+    """Minimal stand-in for a postgrest query builder over the local store."""
+
+    def __init__(self, store: "LocalSiteStore", name: str, params: Dict[str, Any] = None):
+        self.store = store
+        self.name = name
+        self.params = params or {}
+        self.filters: List[tuple] = []
+
+    def select(self, columns: str):
+        self.params['columns'] = columns
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(('eq', column, value))
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(('gt', column, value))
+        return self
+
+    def in_(self, column: str, values):
+        self.filters.append(('in', column, list(values)))
+        return self
+
+    def like(self, column: str, pattern: str):
+        self.filters.append(('like', column, pattern))
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        if self.store.latency_seconds:
+            time.sleep(self.store.latency_seconds)
+        return SimpleNamespace(data=self.store.run(self))
+
+
+class LocalSiteStore:
+    """In-memory site_pages with vector, page-summary and keyword (BM25) search and the tables the tools read."""
+
+    def __init__(self, chunks: List[Dict[str, Any]], latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.chunks = [{**chunk, 'metadata': chunk.get('metadata') or {'source': 'pydantic_ai_docs'}} for chunk in chunks]
+        self.by_id = {chunk['id']: chunk for chunk in self.chunks}
+        self.matrix = np.asarray(
+            [hash_embedding(f"{c['title']} {c['summary']} {c['content']}") for c in self.chunks], dtype=np.float32
+        )
+        self.doc_terms = [Counter(tokenize(f"{c['title']} {c['summary']} {c['content']}")) for c in self.chunks]
+        self.avg_len = sum(sum(terms.values()) for terms in self.doc_terms) / max(1, len(self.doc_terms))
+        document_frequency = Counter(term for terms in self.doc_terms for term in terms)
+        pages: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in sorted(self.chunks, key=lambda chunk: chunk['chunk_number']):
+            pages.setdefault(chunk['url'], []).append(chunk)
+        # Page-level summary index, built the way the ingest script fills site_page_catalog
+        self.page_urls = list(pages)
+        self.page_matrix = np.asarray([
+            hash_embedding("\n".join([rows[0]['title'].split(' - ')[0]] + [row['summary'] for row in rows]))
+            for rows in pages.values()
+        ], dtype=np.float32)
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def rpc(self, name: str, params: Dict[str, Any]):
+        return LocalQuery(self, name, dict(params))
+
+    def from_(self, table: str):
+        return LocalQuery(self, table)
+
+    table = from_
+
+    @staticmethod
+    def _public(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in chunk.items() if key != 'embedding'}
+
+    def _vector(self, embedding: List[float], match_count: int, urls: List[str] = None) -> List[Dict[str, Any]]:
+        similarities = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        if urls is not None:
+            allowed = np.asarray([chunk['url'] in urls for chunk in self.chunks])
+            similarities = np.where(allowed, similarities, -np.inf)
+        top = [i for i in np.argsort(-similarities)[:match_count] if np.isfinite(similarities[i])]
+        return [{**self._public(self.chunks[i]), 'similarity': float(similarities[i])} for i in top]
+
+    def _page_summaries(self, embedding: List[float], match_count: int) -> List[Dict[str, Any]]:
+        similarities = self.page_matrix @ np.asarray(embedding, dtype=np.float32)
+        top = np.argsort(-similarities)[:match_count]
+        return [{'url': self.page_urls[i], 'similarity': float(similarities[i])} for i in top]
+
+    def _keyword(self, query: str, match_count: int, k1: float = 1.5, b: float = 0.75) -> List[Dict[str, Any]]:
+        terms = tokenize(query)
+        scores = []
+        for i, doc_terms in enumerate(self.doc_terms):
+            length = sum(doc_terms.values())
+            score = sum(
+                self.idf.get(term, 0.0) * doc_terms[term] * (k1 + 1)
+                / (doc_terms[term] + k1 * (1 - b + b * length / self.avg_len))
+                for term in terms if term in doc_terms
+            )
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [{**self._public(self.chunks[i]), 'rank': score} for score, i in scores[:match_count]]
+
+    def run(self, query: LocalQuery) -> List[Dict[str, Any]]:
+        if query.name == 'match_site_pages':
+            return self._vector(query.params['query_embedding'], query.params['match_count'])
+        if query.name == 'match_page_summaries':
+            return self._page_summaries(query.params['query_embedding'], query.params['match_count'])
+        if query.name == 'match_site_pages_in_urls':
+            return self._vector(query.params['query_embedding'], query.params['match_count'], set(query.params['urls']))
+        if query.name == 'get_site_page_windows':
+            return [
+                self._public(chunk) for window in query.params['windows'] for chunk in self.chunks
+                if chunk['url'] == window['url'] and window['first_chunk'] <= chunk['chunk_number'] <= window['last_chunk']
+            ]
+        if query.name == 'keyword_match_site_pages':
+            return self._keyword(query.params['query_text'], query.params['match_count'])
+        if query.name == 'site_pages_index':
+            return [{'version': 1}]
+        if query.name == 'site_page_catalog':
+            urls = sorted({chunk['url'] for chunk in self.chunks})
+            for op, column, value in query.filters:
+                if op == 'like' and column == 'url_path':
+                    urls = [url for url in urls if urlparse(url).path.startswith(value.rstrip('%'))]
+            return [{'url': url} for url in urls]
+        if query.name == 'site_pages':
+            rows = self.chunks
+            for op, column, value in query.filters:
+                if op == 'in' and column == 'id':
+                    rows = [self.by_id[i] for i in value if i in self.by_id]
+                elif op == 'eq' and column == 'url':
+                    rows = [row for row in rows if row['url'] == value]
+            if 'embedding' in query.params.get('columns', ''):
+                return [{'id': row['id'], 'embedding': self.matrix[self.chunks.index(row)].tolist()} for row in rows]
+            return [self._public(row) for row in sorted(rows, key=lambda row: row['chunk_number'])]
+        return []
+
+
+def synthetic_corpus(pages: int = 40, chunks_per_page: int = 4, seed: int = 7) -> Dict[str, Any]:
+    """
+    Pages about distinct topics; every chunk documents one identifier. Queries
+    ask either for the exact identifier or describe the chunk's topic in other words.
+    """
+    rng = random.Random(seed)
+    topics = ["agent", "session", "memory", "tool", "callback", "runner", "artifact", "event",
+              "planner", "model", "state", "deployment", "evaluation", "streaming", "auth", "workflow"]
+    verbs = ["configure", "create", "register", "validate", "stream", "persist", "resume", "inspect"]
+    filler = ("The framework handles this automatically in most cases, but you can override the default "
+              "behaviour when you need finer control over how requests are processed. ")
+    chunks, queries = [], []
+    chunk_id = 1
+    for page in range(pages):
+        topic = topics[page % len(topics)]
+        url = f"https://docs.example.com/{topic}/page-{page}/"
+        for number in range(chunks_per_page):
+            verb = rng.choice(verbs)
+            identifier = f"{verb}_{topic}_{page}_{number}"
+            detail = rng.choice(["timeouts", "retries", "serialization", "concurrency", "permissions", "logging"])
+            content = (
+                f"## {identifier}\n\nUse `{identifier}` to {verb} the {topic} {detail} settings. "
+                f"It accepts a config object describing {detail} for each {topic}. " + filler * rng.randint(3, 12)
+            )
+            chunks.append({
+                'id': chunk_id, 'url': url, 'chunk_number': number,
+                'title': f"{topic.title()} {detail} - Docs", 'summary': f"How to {verb} {topic} {detail}",
+                'content': content,
+            })
+            queries.append({'query': f"What does {identifier} do?", 'relevant_ids': [chunk_id], 'kind': 'identifier'})
+            if number == 0:
+                queries.append({
+                    'query': f"how can I {verb} {detail} for a {topic} in page {page}",
+                    'relevant_ids': [chunk_id], 'kind': 'paraphrase',
+                })
+            chunk_id += 1
+    return {'chunks': chunks, 'queries': queries}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def reset_caches():
+    """Every query of the cold pass is measured cold so caching does not hide retrieval cost."""
+    ai_expert.retrieval_cache = SemanticRetrievalCache()
+    ai_expert.page_cache = VersionedLRUCache()
+
+
+async def run_benchmark(corpus: Dict[str, Any], k: int, latency_seconds: float) -> Dict[str, Any]:
+    store = LocalSiteStore(corpus['chunks'], latency_seconds=latency_seconds)
+    chunk_contents = {chunk['id']: chunk['content'] for chunk in corpus['chunks']}
+
+    async def local_embedding(query: str) -> List[float]:
+        return hash_embedding(query)
+
+    async def local_embeddings(queries: List[str]) -> List[List[float]]:
+        return [hash_embedding(query) for query in queries]
+
+    ai_expert.get_query_embedding = local_embedding
+    ai_expert.get_query_embeddings = local_embeddings
+    ctx = SimpleNamespace(deps=ai_expert.PydanticAIDeps(supabase=store))
+
+    latencies, token_counts, reciprocal_ranks, recalls, context_hits = [], [], [], [], []
+    per_kind: Dict[str, List[float]] = {}
+    for item in corpus['queries']:
+        reset_caches()
+        relevant = set(item['relevant_ids'])
+
+        # Ranking quality is measured on the fused candidates before packing
+        embedding = await local_embedding(item['query'])
+        ranked = [doc['id'] for doc in await ai_expert.search_chunks(store, item['query'], embedding)]
+        top_k = ranked[:k]
+        recalls.append(len(relevant & set(top_k)) / len(relevant))
+        first_hit = next((rank for rank, doc_id in enumerate(ranked, start=1) if doc_id in relevant), None)
+        reciprocal_ranks.append(1 / first_hit if first_hit else 0.0)
+        per_kind.setdefault(item.get('kind', 'all'), []).append(recalls[-1])
+
+        # Latency and size are measured on the full tool call the model sees
+        reset_caches()
+        start = time.perf_counter()
+        output = await ai_expert.retrieve_relevant_documentation(ctx, item['query'])
+        latencies.append((time.perf_counter() - start) * 1000)
+        token_counts.append(count_tokens(output))
+        context_hits.append(any(chunk_contents[doc_id][:80] in output for doc_id in relevant))
+
+    # Warm pass: one cache shared by all queries, as in a running app. A lower recall
+    # than the cold pass means the semantic cache served chunks for a different question.
+    reset_caches()
+    warm_recalls, warm_latencies = [], []
+    for item in corpus['queries']:
+        relevant = set(item['relevant_ids'])
+        start = time.perf_counter()
+        embedding = await local_embedding(item['query'])
+        ranked = [doc['id'] for doc in await ai_expert.search_chunks(store, item['query'], embedding)]
+        warm_latencies.append((time.perf_counter() - start) * 1000)
+        warm_recalls.append(len(relevant & set(ranked[:k])) / len(relevant))
+    cache_stats = ai_expert.retrieval_cache.stats()
+
+    n = len(corpus['queries'])
+    return {
+        'queries': n,
+        'chunks': len(corpus['chunks']),
+        f'recall@{k}': sum(recalls) / n,
+        'mrr': sum(reciprocal_ranks) / n,
+        'context_hit_rate': sum(context_hits) / n,
+        f'recall@{k}_by_kind': {kind: sum(values) / len(values) for kind, values in per_kind.items()},
+        'latency_ms': {'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99), 'mean': sum(latencies) / n},
+        'tokens_returned': {'mean': sum(token_counts) / n, 'p50': percentile(token_counts, 50), 'max': max(token_counts)},
+        'warm_cache': {
+            f'recall@{k}': sum(warm_recalls) / n,
+            'cache_hit_rate': cache_stats['hit_rate'],
+            'latency_ms': {'p50': percentile(warm_latencies, 50), 'p99': percentile(warm_latencies, 99)},
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Recorded corpus JSON (default: synthetic corpus)')
+    parser.add_argument('--pages', type=int, default=40, help='Synthetic corpus pages')
+    parser.add_argument('--chunks-per-page', type=int, default=4, help='Synthetic corpus chunks per page')
+    parser.add_argument('-k', type=int, default=ai_expert.hybrid_search_config.match_count, help='Cutoff for recall@k')
+    parser.add_argument('--rpc-latency-ms', type=float, default=0.0, help='Simulated latency per store query')
+    parser.add_argument('--output', help='Where to write the JSON results (default: benchmark_results/<commit>.json)')
+    args = parser.parse_args()
+    logfire.configure(send_to_logfire='never', console=False)
+
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            corpus = json.load(f)
+    else:
+        corpus = synthetic_corpus(args.pages, args.chunks_per_page)
+
+    metrics = asyncio.run(run_benchmark(corpus, args.k, args.rpc_latency_ms / 1000))
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'corpus': args.corpus or f'synthetic:{args.pages}x{args.chunks_per_page}',
+        'config': {
+            'hybrid': vars(ai_expert.hybrid_search_config),
+            'packing': vars(ai_expert.packing_config),
+            'rpc_latency_ms': args.rpc_latency_ms,
+        },
+        'metrics': metrics,
+    }
+
+    output = args.output or os.path.join('benchmark_results', f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(metrics, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# pyright: reportMissingImports=false
+"""SQLite-backed conversation history for the RAG UI, appended incrementally and read back a page of turns at a time."""
+import os
+import sqlite3
+import time
+from typing import List
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+
+
+class ChatHistoryStore:
+    """
+    Stores pydantic_ai messages per conversation, numbered by turn (a user
+    prompt and everything the agent produced for it). Reads are by whole
+    turns, so a page never splits a tool call from its return.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "create table if not exists chat_messages ("
+                "id integer primary key autoincrement, "
+                "conversation_id text not null, "
+                "turn integer not null, "
+                "message text not null, "
+                "created_at real not null)"
+            )
+            conn.execute(
+                "create index if not exists idx_chat_messages_conversation_turn "
+                "on chat_messages (conversation_id, turn)"
+            )
+
+    def last_turn(self, conversation_id: str) -> int:
+        """Number of the latest turn, 0 for an empty conversation."""
+        with sqlite3.connect(self.path) as conn:
+            row = conn.execute(
+                "select max(turn) from chat_messages where conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def append(self, conversation_id: str, turn: int, messages: List[ModelMessage]):
+        if not messages:
+            return
+        now = time.time()
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany(
+                "insert into chat_messages (conversation_id, turn, message, created_at) values (?, ?, ?, ?)",
+                [
+                    (conversation_id, turn, ModelMessagesTypeAdapter.dump_json([message]).decode("utf-8"), now)
+                    for message in messages
+                ],
+            )
+
+    def recent_turns(self, conversation_id: str, turns: int) -> List[ModelMessage]:
+        """Messages of the last `turns` turns, oldest first."""
+        with sqlite3.connect(self.path) as conn:
+            rows = conn.execute(
+                "select message from chat_messages "
+                "where conversation_id = ? and turn > "
+                "(select coalesce(max(turn), 0) from chat_messages where conversation_id = ?) - ? "
+                "order by id",
+                (conversation_id, conversation_id, turns),
+            ).fetchall()
+        return [message for (value,) in rows for message in ModelMessagesTypeAdapter.validate_json(value)]
+
+    def clear(self, conversation_id: str):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("delete from chat_messages where conversation_id = ?", (conversation_id,))
+
+
+def chat_history_store_from_env() -> ChatHistoryStore:
+    return ChatHistoryStore(os.getenv("CHAT_HISTORY_DB", ".chat_history.sqlite3"))
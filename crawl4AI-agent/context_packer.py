@@ -0,0 +1,276 @@
+# pyright: reportMissingImports=false
+"""Pack retrieved chunks into a diverse, token-budgeted context for the model."""
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tokens import count_tokens
+
+SECTION_SEPARATOR = "\n\n---\n\n"
+TRUNCATION_MARKER = "\n\n[...]"
+
+
+@dataclass
+class PackingConfig:
+    candidate_count: int = 20  # chunks over-fetched before diversification
+    max_chunks: int = 6
+    mmr_lambda: float = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+    token_budget: int = 3000
+    neighbor_chunks: int = 0  # chunks before and after each hit to include
+
+    @classmethod
+    def from_env(cls) -> "PackingConfig":
+        return cls(
+            candidate_count=int(os.getenv("CONTEXT_CANDIDATE_COUNT", "20")),
+            max_chunks=int(os.getenv("CONTEXT_MAX_CHUNKS", "6")),
+            mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+            neighbor_chunks=int(os.getenv("CONTEXT_NEIGHBOR_CHUNKS", "0")),
+        )
+
+
+@dataclass
+class PackingStats:
+    candidates: int
+    selected: int
+    sections: int
+    tokens: int
+    baseline_tokens: int  # what joining the top chunks unpacked would have cost
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+
+def format_chunk(title: str, content: str) -> str:
+    return f"# {title}\n\n{content}"
+
+
+def _relevance(candidates: List[Dict[str, Any]], query: np.ndarray, vectors: List[Optional[np.ndarray]]) -> np.ndarray:
+    """Fused score when present (normalized to [0, 1]), cosine similarity to the query otherwise."""
+    if all('rrf_score' in doc for doc in candidates):
+        scores = np.asarray([doc['rrf_score'] for doc in candidates], dtype=np.float32)
+        return scores / (scores.max() or 1)
+    return np.asarray([float(v @ query) if v is not None else 0.0 for v in vectors], dtype=np.float32)
+
+
+def mmr_select(
+    query_embedding: List[float],
+    candidates: List[Dict[str, Any]],
+    embeddings: Dict[Any, List[float]],
+    k: int,
+    mmr_lambda: float,
+) -> List[Dict[str, Any]]:
+    """
+    Maximal marginal relevance: repeatedly pick the candidate maximizing
+    lambda * relevance - (1 - lambda) * max similarity to what is already picked.
+    Candidates without an embedding are never penalized as near-duplicates.
+    """
+    if not candidates:
+        return []
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1)
+    vectors: List[Optional[np.ndarray]] = []
+    for doc in candidates:
+        vector = embeddings.get(doc['id'])
+        if vector is None:
+            vectors.append(None)
+        else:
+            vector = np.asarray(vector, dtype=np.float32)
+            vectors.append(vector / (np.linalg.norm(vector) or 1))
+    relevance = _relevance(candidates, query, vectors)
+
+    selected: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        best, best_score = remaining[0], -np.inf
+        for i in remaining:
+            redundancy = max(
+                (float(vectors[i] @ vectors[j]) for j in selected if vectors[i] is not None and vectors[j] is not None),
+                default=0.0,
+            )
+            score = mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        selected.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    Merge selected chunks that are consecutive on the same page into one
+    (title, content) section, keeping sections in order of their best-ranked chunk.
+    """
+    by_url: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for rank, doc in enumerate(chunks):
+        by_url.setdefault(doc['url'], []).append((rank, doc))
+
+    sections: List[Tuple[int, str, str]] = []
+    for docs in by_url.values():
+        docs.sort(key=lambda item: item[1]['chunk_number'])
+        run = [docs[0]]
+        for item in docs[1:]:
+            if item[1]['chunk_number'] == run[-1][1]['chunk_number'] + 1:
+                run.append(item)
+                continue
+            sections.append(_section(run))
+            run = [item]
+        sections.append(_section(run))
+    sections.sort(key=lambda section: section[0])
+    return [(title, content) for _, title, content in sections]
+
+
+def _section(run: List[Tuple[int, Dict[str, Any]]]) -> Tuple[int, str, str]:
+    best_rank = min(rank for rank, _ in run)
+    title = run[0][1]['title']
+    content = "\n\n".join(doc['content'] for _, doc in run)
+    return best_rank, title, content
+
+
+def merge_windows(chunks: List[Dict[str, Any]], radius: int) -> List[Dict[str, Any]]:
+    """
+    Windows of +-`radius` chunks around each hit, with overlapping or touching
+    windows on the same page merged, ordered by their best-ranked hit. Each
+    window lists the chunk numbers of its hits.
+    """
+    by_url: Dict[str, List[Tuple[int, int, int, int]]] = {}
+    for rank, doc in enumerate(chunks):
+        number = doc['chunk_number']
+        by_url.setdefault(doc['url'], []).append((max(0, number - radius), number + radius, rank, number))
+
+    windows = []
+    for url, intervals in by_url.items():
+        intervals.sort()
+        first, last, best, hit = intervals[0]
+        hits = [hit]
+        for start, end, rank, hit in intervals[1:]:
+            if start <= last + 1:
+                last, best = max(last, end), min(best, rank)
+                hits.append(hit)
+                continue
+            windows.append((best, {'url': url, 'first_chunk': first, 'last_chunk': last, 'hits': hits}))
+            first, last, best, hits = start, end, rank, [hit]
+        windows.append((best, {'url': url, 'first_chunk': first, 'last_chunk': last, 'hits': hits}))
+    windows.sort(key=lambda window: window[0])
+    return [window for _, window in windows]
+
+
+def _grow_window(members: Dict[int, Dict[str, Any]], hits: List[int], allowance: int) -> List[int]:
+    """
+    Chunk numbers of a window to include: every hit, then neighbours one ring
+    of distance at a time on both sides, while they fit in `allowance` tokens.
+    """
+    included = {hit for hit in hits if hit in members}
+    for distance in range(1, max(members) - min(members) + 1):
+        ring = sorted({
+            number for hit in hits for number in (hit - distance, hit + distance)
+            if number in members and number not in included
+        })
+        if not ring:
+            continue
+        cost = sum(count_tokens(members[number]['content']) for number in ring)
+        if cost > allowance:
+            break
+        allowance -= cost
+        included.update(ring)
+    return sorted(included)
+
+
+def window_sections(
+    windows: List[Dict[str, Any]], rows: List[Dict[str, Any]], token_budget: Optional[int] = None
+) -> List[Tuple[str, str]]:
+    """
+    Join the fetched rows of each window into one (title, content) section.
+
+    Hit chunks are always kept whole. With `token_budget`, what the hits leave
+    over is split evenly between windows, and each window adds neighbours
+    symmetrically outward from its hits until its share is used, so leading
+    neighbours can't crowd out the hit or the windows of later hits.
+    """
+    window_members = []
+    for window in windows:
+        members = {
+            row['chunk_number']: row for row in rows
+            if row['url'] == window['url'] and window['first_chunk'] <= row['chunk_number'] <= window['last_chunk']
+        }
+        window_members.append(members)
+
+    allowance = None
+    if token_budget is not None and windows:
+        hit_tokens = sum(
+            count_tokens(format_chunk(members[hit]['title'], members[hit]['content'])) + count_tokens(SECTION_SEPARATOR)
+            for window, members in zip(windows, window_members)
+            for hit in window.get('hits', []) if hit in members
+        )
+        allowance = max(0, token_budget - hit_tokens) // len(windows)
+
+    sections = []
+    for window, members in zip(windows, window_members):
+        if not members:
+            continue
+        if allowance is None or 'hits' not in window:
+            numbers = sorted(members)
+        else:
+            numbers = _grow_window(members, window['hits'], allowance) or sorted(members)
+        parts = []
+        for index, number in enumerate(numbers):
+            # Mark where chunks between two hits were left out
+            if index and number != numbers[index - 1] + 1:
+                parts.append("[...]")
+            parts.append(members[number]['content'])
+        sections.append((members[numbers[0]]['title'], "\n\n".join(parts)))
+    return sections
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly `max_tokens`, preferring a paragraph boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_tokens -= count_tokens(TRUNCATION_MARKER)
+    cut = text[:max(0, max_tokens * 4)]
+    while cut and count_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    paragraph = cut.rfind("\n\n")
+    if paragraph > len(cut) * 0.5:
+        cut = cut[:paragraph]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def pack_sections(
+    sections: List[Tuple[str, str]],
+    candidates: List[Dict[str, Any]],
+    selected_count: int,
+    config: PackingConfig,
+    baseline_count: int = 5,
+) -> Tuple[str, PackingStats]:
+    """Fit sections, best first, into the token budget."""
+    baseline = SECTION_SEPARATOR.join(format_chunk(doc['title'], doc['content']) for doc in candidates[:baseline_count])
+
+    packed: List[str] = []
+    used = 0
+    separator_tokens = count_tokens(SECTION_SEPARATOR)
+    for title, content in sections:
+        remaining = config.token_budget - used - (separator_tokens if packed else 0)
+        section = format_chunk(title, content)
+        tokens = count_tokens(section)
+        if tokens > remaining:
+            # Keep a truncated piece of the section if a useful amount of budget is left
+            if remaining < 100:
+                break
+            section = _truncate_to_tokens(section, remaining)
+            tokens = count_tokens(section)
+        packed.append(section)
+        used += tokens + (separator_tokens if len(packed) > 1 else 0)
+
+    text = SECTION_SEPARATOR.join(packed)
+    stats = PackingStats(
+        candidates=len(candidates),
+        selected=selected_count,
+        sections=len(packed),
+        tokens=count_tokens(text),
+        baseline_tokens=count_tokens(baseline),
+    )
+    return text, stats
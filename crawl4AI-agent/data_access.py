@@ -0,0 +1,49 @@
+# pyright: reportMissingImports=false
+"""Run blocking supabase queries off the event loop in a bounded thread pool."""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+
+class SupabaseExecutor:
+    """
+    The supabase client is synchronous: `.execute()` blocks on HTTP. Tools hand
+    their query builders to `execute`, which runs them on a bounded pool of
+    worker threads so the event loop (and Streamlit token streaming) keeps going.
+    """
+
+    def __init__(self, max_workers: int = 8, timeout_seconds: float = 15):
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='supabase')
+
+    async def execute(self, query: Any, timeout_seconds: float = None) -> Any:
+        """Execute a supabase/postgrest query builder off-loop; raises TimeoutError if it takes too long."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._executor, query.execute),
+            timeout=timeout_seconds or self.timeout_seconds,
+        )
+
+    async def call(self, fn, *args, timeout_seconds: float = None) -> Any:
+        """Run any other blocking function on the same pool."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._executor, lambda: fn(*args)),
+            timeout=timeout_seconds or self.timeout_seconds,
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def supabase_executor_from_env() -> SupabaseExecutor:
+    return SupabaseExecutor(
+        max_workers=int(os.getenv("SUPABASE_MAX_WORKERS", "8")),
+        timeout_seconds=float(os.getenv("SUPABASE_QUERY_TIMEOUT_SECONDS", "15")),
+    )
+
+
+# Shared by every retrieval tool in the process
+supabase_executor = supabase_executor_from_env()
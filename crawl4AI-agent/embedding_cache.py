@@ -0,0 +1,231 @@
+# pyright: reportMissingImports=false
+"""Query embedding cache: in-process LRU with TTL plus an optional shared tier."""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query used for cache keys."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def cache_key(query: str, deployment: str) -> str:
+    return hashlib.sha256(f"{deployment}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+class SqliteEmbeddingTier:
+    """Shared tier backed by a local SQLite file, usable by several processes on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "create table if not exists query_embeddings "
+                "(key text primary key, embedding text not null, expires_at real not null)"
+            )
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        with sqlite3.connect(self.path) as conn:
+            row = conn.execute(
+                "select embedding from query_embeddings where key = ? and expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, embedding: List[float], ttl_seconds: float):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "insert or replace into query_embeddings (key, embedding, expires_at) values (?, ?, ?)",
+                (key, json.dumps(embedding), time.time() + ttl_seconds),
+            )
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, embedding: List[float], ttl_seconds: float):
+        await asyncio.to_thread(self._set, key, embedding, ttl_seconds)
+
+
+class RedisEmbeddingTier:
+    """Shared tier for any Redis-compatible server (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str, prefix: str = "query-embedding:"):
+        import redis.asyncio as redis  # optional dependency, only needed for this tier
+
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        value = await self._redis.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    async def set(self, key: str, embedding: List[float], ttl_seconds: float):
+        await self._redis.set(self.prefix + key, json.dumps(embedding), ex=int(ttl_seconds))
+
+
+def shared_tier_from_url(url: Optional[str]):
+    """Build a shared tier from `redis://...`, `rediss://...` or `sqlite:///path` (None disables it)."""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEmbeddingTier(url)
+    if url.startswith("sqlite:///"):
+        return SqliteEmbeddingTier(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported embedding cache URL: {url}")
+
+
+class QueryEmbeddingCache:
+    """
+    Async-safe cache of query embeddings keyed by normalized query text and deployment.
+
+    Concurrent misses for the same key share a single embeddings API call.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, shared_tier=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared_tier = shared_tier
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()  # plain lock: Streamlit reruns use a new event loop each time
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, embedding = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def _set_local(self, key: str, embedding: List[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _load(self, key: str, query: str, embed: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        if self.shared_tier is not None:
+            try:
+                embedding = await self.shared_tier.get(key)
+            except Exception as e:
+                print(f"Error reading shared embedding cache: {e}")
+                embedding = None
+            if embedding is not None:
+                self.shared_hits += 1
+                self._set_local(key, embedding)
+                return embedding
+
+        self.misses += 1
+        embedding = await embed(query)
+        self._set_local(key, embedding)
+        if self.shared_tier is not None:
+            try:
+                await self.shared_tier.set(key, embedding, self.ttl_seconds)
+            except Exception as e:
+                print(f"Error writing shared embedding cache: {e}")
+        return embedding
+
+    async def get_or_create(
+        self, query: str, deployment: str, embed: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Return the cached embedding for `query`, calling `embed` only on a miss."""
+        key = cache_key(query, deployment)
+        embedding = self._get_local(key)
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+
+        loop = asyncio.get_running_loop()
+        pending = self._inflight.get(key)
+        if pending is not None and pending.get_loop() is loop:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            embedding = await self._load(key, query, embed)
+            future.set_result(embedding)
+            return embedding
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved so a lone waiter-less failure is not logged
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def get_or_create_many(
+        self, queries: List[str], deployment: str, embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]
+    ) -> List[List[float]]:
+        """Batch variant of `get_or_create`: all misses are embedded with a single `embed_many` call."""
+        keys = [cache_key(query, deployment) for query in queries]
+        embeddings: Dict[str, List[float]] = {}
+        for key in keys:
+            embedding = self._get_local(key)
+            if embedding is not None:
+                self.hits += 1
+                embeddings[key] = embedding
+
+        missing = {key: query for key, query in zip(keys, queries) if key not in embeddings}
+        if missing and self.shared_tier is not None:
+            for key in list(missing):
+                try:
+                    embedding = await self.shared_tier.get(key)
+                except Exception as e:
+                    print(f"Error reading shared embedding cache: {e}")
+                    embedding = None
+                if embedding is not None:
+                    self.shared_hits += 1
+                    self._set_local(key, embedding)
+                    embeddings[key] = embedding
+                    del missing[key]
+
+        if missing:
+            self.misses += len(missing)
+            for key, embedding in zip(missing, await embed_many(list(missing.values()))):
+                self._set_local(key, embedding)
+                embeddings[key] = embedding
+                if self.shared_tier is not None:
+                    try:
+                        await self.shared_tier.set(key, embedding, self.ttl_seconds)
+                    except Exception as e:
+                        print(f"Error writing shared embedding cache: {e}")
+        return [embeddings[key] for key in keys]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+def query_embedding_cache_from_env() -> QueryEmbeddingCache:
+    return QueryEmbeddingCache(
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600")),
+        shared_tier=shared_tier_from_url(os.getenv("EMBEDDING_CACHE_URL")),
+    )
@@ -0,0 +1,118 @@
+# pyright: reportMissingImports=false
+"""Keep the conversation history sent to the model bounded as a chat session grows."""
+import os
+from dataclasses import dataclass, replace
+from typing import List
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    RetryPromptPart,
+    SystemPromptPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from tokens import count_tokens
+
+OMITTED_PREFIX = "[omitted from history"
+
+
+@dataclass
+class HistoryConfig:
+    keep_turns: int = 3  # most recent turns whose tool returns are kept verbatim
+    token_budget: int = 6000  # upper bound for the whole history sent with a new question
+    load_turns: int = 20  # turns read back from the chat history store before compaction
+
+    @classmethod
+    def from_env(cls) -> "HistoryConfig":
+        return cls(
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "3")),
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "6000")),
+            load_turns=int(os.getenv("HISTORY_LOAD_TURNS", "20")),
+        )
+
+
+def part_tokens(part) -> int:
+    if isinstance(part, ToolReturnPart):
+        return count_tokens(part.model_response_str())
+    if isinstance(part, ToolCallPart):
+        return count_tokens(part.tool_name) + count_tokens(part.args_as_json_str())
+    return count_tokens(str(part.content))
+
+
+def history_tokens(messages: List[ModelMessage]) -> int:
+    return sum(part_tokens(part) for message in messages for part in message.parts)
+
+
+def split_turns(messages: List[ModelMessage]) -> List[List[ModelMessage]]:
+    """Group messages into turns, each starting at a request with a user prompt."""
+    turns: List[List[ModelMessage]] = []
+    for message in messages:
+        starts_turn = isinstance(message, ModelRequest) and any(isinstance(part, UserPromptPart) for part in message.parts)
+        if starts_turn or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def elide_tool_returns(messages: List[ModelMessage]) -> List[ModelMessage]:
+    """
+    Replace tool outputs (retrieved documentation) with a one-line note. The
+    tool calls stay, so the model still sees what was looked up, and every
+    call keeps its matching return as the chat API requires.
+    """
+    compacted = []
+    for message in messages:
+        if isinstance(message, ModelRequest):
+            parts = []
+            for part in message.parts:
+                if isinstance(part, ToolReturnPart) and not str(part.content).startswith(OMITTED_PREFIX):
+                    part = replace(part, content=f"{OMITTED_PREFIX}: {part_tokens(part)} tokens of {part.tool_name} output]")
+                elif isinstance(part, RetryPromptPart) and part.tool_name:
+                    part = replace(part, content=f"{OMITTED_PREFIX}: retry prompt]")
+                parts.append(part)
+            message = replace(message, parts=parts)
+        compacted.append(message)
+    return compacted
+
+
+def _without_user_turn(turn: List[ModelMessage]) -> List[ModelMessage]:
+    """Only the system prompt parts of a dropped turn, which the agent does not resend with a history."""
+    kept = []
+    for message in turn:
+        if isinstance(message, ModelRequest):
+            parts = [part for part in message.parts if isinstance(part, SystemPromptPart)]
+            if parts:
+                kept.append(replace(message, parts=parts))
+    return kept
+
+
+def compact_history(messages: List[ModelMessage], config: HistoryConfig) -> List[ModelMessage]:
+    """
+    Bound the history passed as `message_history`: tool outputs older than the
+    last `keep_turns` turns are elided. If the history still exceeds
+    `token_budget`, tool outputs of the remaining turns are elided oldest
+    first, and only then are whole (already elided) turns dropped oldest first.
+    The latest turn is only ever elided, never dropped.
+    """
+    turns = split_turns(messages)
+    cutoff = max(0, len(turns) - config.keep_turns)
+    turns = [elide_tool_returns(turn) for turn in turns[:cutoff]] + turns[cutoff:]
+
+    def over_budget() -> bool:
+        return history_tokens([m for turn in turns for m in turn]) > config.token_budget
+
+    # Questions and answers are worth more than the documentation retrieved for them
+    for index in range(cutoff, len(turns)):
+        if not over_budget():
+            break
+        turns[index] = elide_tool_returns(turns[index])
+
+    while len(turns) > 1 and over_budget():
+        system = _without_user_turn(turns.pop(0))
+        if system:
+            turns[0] = system + turns[0]
+
+    return [message for turn in turns for message in turn]
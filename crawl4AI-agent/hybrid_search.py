@@ -0,0 +1,198 @@
+# pyright: reportMissingImports=false
+"""Hybrid retrieval: Postgres full-text search and vector search fused with reciprocal rank fusion."""
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from supabase import Client
+
+from ann_index import SitePagesMirror
+from data_access import supabase_executor
+
+
+@dataclass
+class HybridSearchConfig:
+    match_count: int = 5
+    candidate_count: int = 20  # results fetched from each source before fusion
+    vector_weight: float = 1.0
+    keyword_weight: float = 1.0
+    rrf_k: int = 60
+    summary_routing_pages: int = 0  # > 0 enables two-stage search over this many shortlisted pages
+
+    @classmethod
+    def from_env(cls) -> "HybridSearchConfig":
+        return cls(
+            match_count=int(os.getenv("RETRIEVAL_MATCH_COUNT", "5")),
+            candidate_count=int(os.getenv("HYBRID_CANDIDATE_COUNT", "20")),
+            vector_weight=float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0")),
+            keyword_weight=float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0")),
+            rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+            summary_routing_pages=int(os.getenv("SUMMARY_ROUTING_PAGES", "0")),
+        )
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Dict[str, List[Dict[str, Any]]],
+    weights: Dict[str, float],
+    k: int = 60,
+    limit: int = 5,
+) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked result lists: each document scores sum(weight / (k + rank)) over
+    the lists it appears in. Documents are identified by their `id`.
+    """
+    scores: Dict[Any, float] = {}
+    docs: Dict[Any, Dict[str, Any]] = {}
+    for source, results in ranked_lists.items():
+        weight = weights.get(source, 1.0)
+        for rank, doc in enumerate(results, start=1):
+            scores[doc["id"]] = scores.get(doc["id"], 0.0) + weight / (k + rank)
+            docs.setdefault(doc["id"], doc)
+    ranked_ids = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**docs[doc_id], "rrf_score": scores[doc_id]} for doc_id in ranked_ids]
+
+
+def filter_params(filter: Dict[str, Any], path_prefix: Optional[str] = None) -> Dict[str, Any]:
+    """RPC filter arguments: `source` and the path prefix go to indexed columns, other keys to the jsonb metadata filter."""
+    return {
+        'filter': {key: value for key, value in filter.items() if key != 'source'},
+        'source_filter': filter.get('source'),
+        'path_prefix': path_prefix or None,
+    }
+
+
+def vector_search(
+    supabase: Client, query_embedding: List[float], match_count: int, filter: Dict[str, Any], path_prefix: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    result = supabase.rpc(
+        'match_site_pages',
+        {
+            'query_embedding': query_embedding,
+            'match_count': match_count,
+            **filter_params(filter, path_prefix)
+        }
+    ).execute()
+    return result.data or []
+
+
+def two_stage_vector_search(
+    supabase: Client,
+    query_embedding: List[float],
+    page_count: int,
+    match_count: int,
+    filter: Dict[str, Any],
+    path_prefix: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Shortlist pages on the small page-summary index, then re-score only their
+    chunks. Falls back to a full vector search when no page has a summary embedding.
+    """
+    pages = supabase.rpc(
+        'match_page_summaries',
+        {
+            'query_embedding': query_embedding,
+            'match_count': page_count,
+            'source_filter': filter.get('source'),
+            'path_prefix': path_prefix or None
+        }
+    ).execute()
+    if not pages.data:
+        return vector_search(supabase, query_embedding, match_count, filter, path_prefix)
+
+    result = supabase.rpc(
+        'match_site_pages_in_urls',
+        {
+            'query_embedding': query_embedding,
+            'urls': [page['url'] for page in pages.data],
+            'match_count': match_count,
+            'filter': filter_params(filter)['filter'],
+            'source_filter': filter.get('source')
+        }
+    ).execute()
+    return result.data or []
+
+
+def fetch_chunk_embeddings(supabase: Client, ids: List[int]) -> Dict[int, List[float]]:
+    result = supabase.from_('site_pages').select('id, embedding').in_('id', ids).execute()
+    # PostgREST returns pgvector columns as their text form, e.g. "[0.1,0.2,...]"
+    return {
+        row['id']: json.loads(row['embedding']) if isinstance(row['embedding'], str) else row['embedding']
+        for row in result.data or []
+    }
+
+
+def fetch_chunk_windows(supabase: Client, windows: List[Dict[str, Any]], filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """All chunks inside the given (url, first_chunk, last_chunk) windows, in one range query."""
+    result = supabase.rpc(
+        'get_site_page_windows',
+        {
+            'windows': windows,
+            'filter': filter_params(filter)['filter'],
+            'source_filter': filter.get('source')
+        }
+    ).execute()
+    return result.data or []
+
+
+def keyword_search(
+    supabase: Client, query: str, match_count: int, filter: Dict[str, Any], path_prefix: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    result = supabase.rpc(
+        'keyword_match_site_pages',
+        {
+            'query_text': query,
+            'match_count': match_count,
+            **filter_params(filter, path_prefix)
+        }
+    ).execute()
+    return result.data or []
+
+
+async def hybrid_search(
+    supabase: Client,
+    query: str,
+    query_embedding: List[float],
+    config: HybridSearchConfig,
+    filter: Dict[str, Any],
+    mirror: Optional[SitePagesMirror] = None,
+    limit: Optional[int] = None,
+    path_prefix: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run vector and keyword search concurrently and fuse them; falls back to vector-only on keyword errors.
+    Vector search uses the in-process mirror when it is loaded, then two-stage summary routing when
+    enabled; a keyword weight of 0 skips the keyword RPC. `path_prefix` restricts both sides to pages
+    whose URL path starts with it.
+    """
+    async def vector_side():
+        if mirror is not None and mirror.ready:
+            return mirror.search(query_embedding, config.candidate_count, filter, path_prefix)
+        if config.summary_routing_pages > 0:
+            return await supabase_executor.call(
+                two_stage_vector_search, supabase, query_embedding,
+                config.summary_routing_pages, config.candidate_count, filter, path_prefix
+            )
+        return await supabase_executor.call(
+            vector_search, supabase, query_embedding, config.candidate_count, filter, path_prefix
+        )
+
+    async def keyword_side():
+        if config.keyword_weight <= 0:
+            return []
+        return await supabase_executor.call(keyword_search, supabase, query, config.candidate_count, filter, path_prefix)
+
+    vector_results, keyword_results = await asyncio.gather(vector_side(), keyword_side(), return_exceptions=True)
+    if isinstance(vector_results, BaseException):
+        raise vector_results
+    if isinstance(keyword_results, BaseException):
+        print(f"Error in keyword search, using vector results only: {keyword_results}")
+        keyword_results = []
+
+    return reciprocal_rank_fusion(
+        {"vector": vector_results, "keyword": keyword_results},
+        {"vector": config.vector_weight, "keyword": config.keyword_weight},
+        k=config.rrf_k,
+        limit=limit or config.match_count,
+    )
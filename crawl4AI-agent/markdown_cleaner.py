@@ -0,0 +1,187 @@
+# pyright: reportMissingImports=false
+"""Strip repeated site chrome (nav menus, breadcrumbs, footers) from crawled markdown."""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from tokens import count_tokens
+
+# Lines that are site chrome wherever they appear
+CHROME_LINE_PATTERNS = [
+    re.compile(r"^\[?\s*(skip to (main )?content|back to top)\s*\]?", re.IGNORECASE),
+    re.compile(r"edit (this|on) (page|github)", re.IGNORECASE),
+    re.compile(r"^\[?\s*(previous|next)\s*\]?\s*(\(|$)", re.IGNORECASE),
+    re.compile(r"made with .*material for mkdocs", re.IGNORECASE),
+    re.compile(r"^(copyright|©)", re.IGNORECASE),
+    re.compile(r"^(was this page helpful|table of contents)\??$", re.IGNORECASE),
+]
+
+# A markdown link, optionally wrapped in a list bullet: "* [Agents](https://...)"
+LINK_ONLY_LINE = re.compile(r"^\s*(?:[-*+]\s+|\d+\.\s+)?\[[^\]]*\]\([^)]*\)\s*$")
+# Breadcrumbs: two or more links/labels separated by > › » or /
+BREADCRUMB_LINE = re.compile(r"^\s*(?:\[[^\]]*\]\([^)]*\)|[^\[\]\n]{1,40})(?:\s*[>›»/]\s*(?:\[[^\]]*\]\([^)]*\)|[^\[\]\n]{1,40})){2,}\s*$")
+HEADING_LINE = re.compile(r"^#{1,6}\s")
+# Short labels such as "On this page" or "Search"; sentences end in punctuation and are not labels
+SHORT_LABEL_MAX_WORDS = 4
+SENTENCE_END = re.compile(r"[.!?:;]$")
+
+
+@dataclass
+class CleaningStats:
+    chars_before: int
+    chars_after: int
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def chars_removed(self) -> int:
+        return self.chars_before - self.chars_after
+
+    @property
+    def tokens_removed(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def _split_segments(markdown: str) -> List[Tuple[bool, List[str]]]:
+    """Split markdown into (is_code, lines) segments so fenced code is never touched."""
+    segments: List[Tuple[bool, List[str]]] = []
+    current: List[str] = []
+    in_code = False
+    for line in markdown.splitlines():
+        if line.lstrip().startswith("```"):
+            if in_code:
+                current.append(line)
+                segments.append((True, current))
+                current = []
+            else:
+                if current:
+                    segments.append((False, current))
+                current = [line]
+            in_code = not in_code
+            continue
+        current.append(line)
+    if current:
+        segments.append((in_code, current))
+    return segments
+
+
+def _blocks(lines: List[str]) -> List[str]:
+    """Group prose lines into blank-line separated blocks."""
+    return [block for block in "\n".join(lines).split("\n\n") if block.strip()]
+
+
+class BoilerplateCleaner:
+    """
+    Learns which blocks, nav links and short labels repeat across pages of a site
+    and removes them, together with lines that are chrome by structure
+    (breadcrumbs, "edit this page", link-only nav runs before the first heading).
+    A block is removed only when all of its lines are chrome, never line by line.
+
+    Call `observe` for every page of a crawl before calling `clean`.
+    """
+
+    def __init__(self, min_page_fraction: float = 0.5, min_pages: int = 3, min_nav_run: int = 3):
+        self.min_page_fraction = min_page_fraction
+        self.min_pages = min_pages
+        self.min_nav_run = min_nav_run
+        self.page_count = 0
+        self._line_pages: Counter = Counter()
+        self._block_pages: Counter = Counter()
+        self.total_chars_removed = 0
+        self.total_tokens_removed = 0
+
+    def observe(self, markdown: str):
+        """Record each distinct prose line and block of a page once."""
+        lines: Set[str] = set()
+        blocks: Set[str] = set()
+        for is_code, segment in _split_segments(markdown):
+            if is_code:
+                continue
+            lines.update(_normalize(line) for line in segment if line.strip())
+            blocks.update(_normalize(block) for block in _blocks(segment))
+        self.page_count += 1
+        self._line_pages.update(lines)
+        self._block_pages.update(blocks)
+
+    def _is_repeated(self, counter: Counter, key: str) -> bool:
+        if self.page_count < self.min_pages:
+            return False
+        return counter[key] >= max(2, self.min_page_fraction * self.page_count)
+
+    def _is_chrome_line(self, line: str) -> bool:
+        """
+        Chrome by structure, or a repeated nav link or short label. Repeated prose
+        and table rows are not chrome on their own: they are only removed with
+        their whole block.
+        """
+        stripped = line.strip()
+        if not stripped or HEADING_LINE.match(stripped):
+            return False
+        if any(pattern.search(stripped) for pattern in CHROME_LINE_PATTERNS):
+            return True
+        if BREADCRUMB_LINE.match(stripped) and "[" in stripped:
+            return True
+        is_label = (
+            LINK_ONLY_LINE.match(stripped)
+            or (len(stripped.split()) <= SHORT_LABEL_MAX_WORDS
+                and not SENTENCE_END.search(stripped)
+                and not stripped.startswith("|"))
+        )
+        return bool(is_label) and self._is_repeated(self._line_pages, _normalize(stripped))
+
+    def _strip_leading_nav(self, lines: List[str]) -> List[str]:
+        """Drop link-only runs that appear before the first heading of the page."""
+        kept: List[str] = []
+        run: List[str] = []
+        seen_heading = False
+        for line in lines:
+            if not seen_heading and HEADING_LINE.match(line.strip()):
+                seen_heading = True
+            if not seen_heading and LINK_ONLY_LINE.match(line):
+                run.append(line)
+                continue
+            if run and len(run) < self.min_nav_run:
+                kept.extend(run)
+            run = []
+            kept.append(line)
+        if run and len(run) < self.min_nav_run:
+            kept.extend(run)
+        return kept
+
+    def clean(self, markdown: str) -> Tuple[str, CleaningStats]:
+        """Return the page without site chrome and how much was removed."""
+        output: List[str] = []
+        first_prose = True
+        for is_code, segment in _split_segments(markdown):
+            if is_code:
+                output.append("\n".join(segment))
+                continue
+            if first_prose:
+                segment = self._strip_leading_nav(segment)
+                first_prose = False
+            kept_blocks = []
+            for block in _blocks(segment):
+                if self._is_repeated(self._block_pages, _normalize(block)) and not HEADING_LINE.match(block.strip()):
+                    continue
+                # Blocks are kept or dropped whole, so tables, lists and paragraphs stay intact
+                if all(self._is_chrome_line(line) for line in block.split("\n") if line.strip()):
+                    continue
+                kept_blocks.append(block)
+            if kept_blocks:
+                output.append("\n\n".join(kept_blocks))
+        cleaned = "\n\n".join(output).strip()
+
+        stats = CleaningStats(
+            chars_before=len(markdown),
+            chars_after=len(cleaned),
+            tokens_before=count_tokens(markdown),
+            tokens_after=count_tokens(cleaned),
+        )
+        self.total_chars_removed += stats.chars_removed
+        self.total_tokens_removed += stats.tokens_removed
+        return cleaned, stats
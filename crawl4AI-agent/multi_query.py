@@ -0,0 +1,49 @@
+"""Local query expansion and fusion of results across sub-queries."""
+import re
+from typing import Any, Dict, List
+
+from hybrid_search import reciprocal_rank_fusion
+
+# Backticked code, dotted names, CamelCase and snake_case identifiers
+IDENTIFIER_PATTERN = re.compile(
+    r"`([^`]+)`|\b([A-Za-z_][\w]*\.[\w.]+|[a-z]+_[\w]+|[A-Z][a-z0-9]+[A-Z][\w]*)\b"
+)
+
+
+def extract_identifiers(query: str) -> List[str]:
+    """Code identifiers named in a query, in order of first appearance."""
+    identifiers = [match.group(1) or match.group(2) for match in IDENTIFIER_PATTERN.finditer(query)]
+    return list(dict.fromkeys(identifiers))
+
+
+def expand_query(query: str, max_queries: int = 4) -> List[str]:
+    """
+    Split a compound question into sub-questions and add an identifier-only
+    query, without calling a model. The original query always comes first.
+    """
+    queries = [query.strip()]
+    parts = re.split(r"\?\s+|;\s*|\n+|\s+and also\s+", query)
+    queries.extend(part.strip().rstrip("?") + "?" for part in parts if len(part.split()) >= 3)
+
+    identifiers = extract_identifiers(query)
+    if identifiers:
+        queries.append(" ".join(identifiers))
+
+    unique: List[str] = []
+    seen = set()
+    for candidate in queries:
+        key = candidate.lower().rstrip("?")
+        if candidate and key not in seen:
+            seen.add(key)
+            unique.append(candidate)
+    return unique[:max_queries]
+
+
+def fuse_query_results(results_per_query: List[List[Dict[str, Any]]], k: int = 60, limit: int = 20) -> List[Dict[str, Any]]:
+    """Deduplicate chunks across sub-queries, ranking by reciprocal rank fusion."""
+    return reciprocal_rank_fusion(
+        {str(i): results for i, results in enumerate(results_per_query)},
+        weights={},
+        k=k,
+        limit=limit,
+    )
@@ -0,0 +1,40 @@
+# pyright: reportMissingImports=false
+"""Caches for the page catalog and assembled page bodies, scoped to an index version."""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class VersionedLRUCache:
+    """
+    LRU cache whose entries are tagged with the index version they were built
+    from; a lookup with any other version misses, so a re-ingest expires them.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, index_version: Optional[int]) -> Optional[Any]:
+        if index_version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != index_version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, index_version: Optional[int], value: Any):
+        if index_version is None:
+            return
+        with self._lock:
+            self._entries[key] = (index_version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
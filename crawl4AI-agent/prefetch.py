@@ -0,0 +1,83 @@
+# pyright: reportMissingImports=false
+"""Speculative retrieval started when the user submits a question, before the model asks for it."""
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class PrefetchEntry:
+    query: str
+    embedding: "asyncio.Future[List[float]]"
+    chunks: "asyncio.Task[List[Dict[str, Any]]]"
+
+
+class RetrievalPrefetcher:
+    """
+    Holds in-flight or finished retrievals for one agent run. When a retrieval
+    tool is then called with a query whose embedding is within
+    `similarity_threshold` of a prefetched one, it reuses that result instead of
+    searching again.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.9):
+        self.similarity_threshold = similarity_threshold
+        self._entries: List[PrefetchEntry] = []
+        self.hits = 0
+
+    def start(
+        self,
+        query: str,
+        embed: Callable[[str], Awaitable[List[float]]],
+        search: Callable[[str, List[float]], Awaitable[List[Dict[str, Any]]]],
+    ):
+        """Begin embedding and searching `query` in the background."""
+        loop = asyncio.get_running_loop()
+        embedding: asyncio.Future = loop.create_future()
+
+        async def run() -> List[Dict[str, Any]]:
+            try:
+                query_embedding = await embed(query)
+            except asyncio.CancelledError:
+                embedding.cancel()
+                raise
+            except Exception as e:
+                embedding.set_exception(e)
+                raise
+            embedding.set_result(query_embedding)
+            return await search(query, query_embedding)
+
+        self._entries.append(PrefetchEntry(query, embedding, asyncio.create_task(run())))
+
+    async def lookup(self, query_embedding: List[float]) -> Optional[List[Dict[str, Any]]]:
+        """Chunks from a prefetch similar to `query_embedding`, waiting for it if still running."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        for entry in self._entries:
+            # asyncio.wait doesn't cancel the prefetch when this task is cancelled, and
+            # lets a cancellation of this task propagate instead of being mistaken for a failed entry.
+            # The chunks task ends first only if it was cancelled before the embedding was set.
+            await asyncio.wait([entry.embedding, entry.chunks], return_when=asyncio.FIRST_COMPLETED)
+            if not entry.embedding.done() or entry.embedding.cancelled() or entry.embedding.exception() is not None:
+                continue
+            prefetched = np.asarray(entry.embedding.result(), dtype=np.float32)
+            similarity = float(prefetched @ query) / (np.linalg.norm(prefetched) or 1)
+            if similarity < self.similarity_threshold:
+                continue
+            await asyncio.wait([entry.chunks])
+            if entry.chunks.cancelled():
+                continue
+            if entry.chunks.exception() is not None:
+                print(f"Prefetched retrieval failed: {entry.chunks.exception()}")
+                continue
+            self.hits += 1
+            return entry.chunks.result()
+        return None
+
+    def cancel(self):
+        """Drop any prefetch still running once the agent run is over."""
+        for entry in self._entries:
+            entry.chunks.cancel()
+        self._entries = []
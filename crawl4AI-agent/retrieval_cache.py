@@ -0,0 +1,148 @@
+# pyright: reportMissingImports=false
+"""Semantic cache of retrieval results for near-duplicate queries."""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+
+
+@dataclass(eq=False)  # compared by identity: field equality would compare numpy arrays
+class CachedRetrieval:
+    embedding: np.ndarray  # unit-normalized query embedding
+    index_version: int
+    params: str
+    identifiers: FrozenSet[str]
+    chunks: List[Dict[str, Any]]
+    expires_at: float
+
+
+class IndexVersionTracker:
+    """
+    Remembers the current index version for a short interval so the version
+    lookup itself does not add a database round trip to every retrieval.
+    """
+
+    def __init__(self, check_interval_seconds: float = 30):
+        self.check_interval_seconds = check_interval_seconds
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def current(self, fetch: Callable[[], int]) -> Optional[int]:
+        """Return the cached version, refreshing it through `fetch` when stale (None if unknown)."""
+        if self._version is None or time.monotonic() - self._checked_at >= self.check_interval_seconds:
+            try:
+                self._version = fetch()
+            except Exception as e:
+                print(f"Error fetching index version: {e}")
+                self._version = None
+            self._checked_at = time.monotonic()
+        return self._version
+
+    async def current_async(self, fetch: Callable[[], Awaitable[int]]) -> Optional[int]:
+        """Same as `current`, for an async `fetch` so the lookup does not block the event loop."""
+        if self._version is None or time.monotonic() - self._checked_at >= self.check_interval_seconds:
+            try:
+                self._version = await fetch()
+            except Exception as e:
+                print(f"Error fetching index version: {e}")
+                self._version = None
+            self._checked_at = time.monotonic()
+        return self._version
+
+    def invalidate(self):
+        self._version = None
+
+
+class SemanticRetrievalCache:
+    """
+    Reuses the chunk set of an earlier query whose embedding is within
+    `similarity_threshold` cosine similarity of the new one. Entries from an
+    older index version never match, so a re-ingest expires them.
+
+    Queries naming different code identifiers (e.g. `create_session` and
+    `delete_session`) can embed almost identically, so an entry is only reused
+    when the query names exactly the same identifiers.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 256, ttl_seconds: float = 3600):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: List[CachedRetrieval] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        embedding: List[float],
+        index_version: Optional[int],
+        params: str = "",
+        identifiers: Iterable[str] = (),
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached chunks of the most similar matching query, or None."""
+        identifiers = frozenset(identifiers)
+        if index_version is None:
+            return None
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            self._entries = [
+                entry for entry in self._entries
+                if entry.index_version == index_version and entry.expires_at > now
+            ]
+            candidates = [
+                entry for entry in self._entries
+                if entry.params == params and entry.identifiers == identifiers
+            ]
+            if candidates:
+                similarities = np.stack([entry.embedding for entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self.hits += 1
+                    # Keep recently used entries at the end so eviction drops the coldest
+                    self._entries.remove(candidates[best])
+                    self._entries.append(candidates[best])
+                    return candidates[best].chunks
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        embedding: List[float],
+        index_version: Optional[int],
+        chunks: List[Dict[str, Any]],
+        params: str = "",
+        identifiers: Iterable[str] = (),
+    ):
+        if index_version is None:
+            return
+        entry = CachedRetrieval(
+            embedding=self._normalize(embedding),
+            index_version=index_version,
+            params=params,
+            identifiers=frozenset(identifiers),
+            chunks=chunks,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -5,7 +5,7 @@ import json
 import asyncio
 import requests
 from xml.etree import ElementTree
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import urlparse
@@ -16,6 +16,8 @@ from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from openai import AsyncAzureOpenAI
 from supabase import create_client, Client
 
+from markdown_cleaner import BoilerplateCleaner
+
 load_dotenv()
 
 
@@ -181,7 +183,11 @@ async def insert_chunk(chunk: ProcessedChunk):
             "summary": chunk.summary,
             "content": chunk.content,
             "metadata": chunk.metadata,
-            "embedding": chunk.embedding
+            "embedding": chunk.embedding,
+            # Indexed copies of the metadata fields that retrieval filters on
+            "source": chunk.metadata["source"],
+            "url_path": chunk.metadata["url_path"],
+            "crawled_at": chunk.metadata["crawled_at"]
         }
         
         result = supabase.table("site_pages").insert(data).execute()
@@ -191,8 +197,34 @@ async def insert_chunk(chunk: ProcessedChunk):
         print(f"Error inserting chunk: {e}")
         return None
 
-async def process_and_store_document(url: str, markdown: str):
+async def upsert_page_catalog(url: str, processed_chunks: List[ProcessedChunk]):
+    """Record the page's title, chunk count and summary embedding in the page catalog."""
+    try:
+        title = processed_chunks[0].title.split(' - ')[0]
+        # Page summary for the small routing index: the title followed by every chunk summary
+        summary = "\n".join([title] + [chunk.summary for chunk in processed_chunks])
+        data = {
+            "url": url,
+            "source": processed_chunks[0].metadata["source"],
+            "url_path": processed_chunks[0].metadata["url_path"],
+            "title": title,
+            "chunk_count": len(processed_chunks),
+            "summary": summary,
+            "summary_embedding": await get_embedding(summary),
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        return supabase.table("site_page_catalog").upsert(data).execute()
+    except Exception as e:
+        print(f"Error updating page catalog: {e}")
+        return None
+
+async def process_and_store_document(url: str, markdown: str, cleaner: Optional[BoilerplateCleaner] = None):
     """Process a document and store its chunks in parallel."""
+    # Strip site chrome so only page content gets summarized, embedded and stored
+    if cleaner is not None:
+        markdown, stats = cleaner.clean(markdown)
+        print(f"Cleaned {url}: removed {stats.chars_removed} chars / {stats.tokens_removed} tokens")
+
     # Split into chunks
     chunks = chunk_text(markdown)
     
@@ -210,6 +242,9 @@ async def process_and_store_document(url: str, markdown: str):
     ]
     await asyncio.gather(*insert_tasks)
 
+    if processed_chunks:
+        await upsert_page_catalog(url, processed_chunks)
+
 async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     """Crawl multiple URLs in parallel with a concurrency limit."""
     browser_config = BrowserConfig(
@@ -226,8 +261,9 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     try:
         # Create a semaphore to limit concurrency
         semaphore = asyncio.Semaphore(max_concurrent)
+        pages: Dict[str, str] = {}
         
-        async def process_url(url: str):
+        async def crawl_url(url: str):
             async with semaphore:
                 result = await crawler.arun(
                     url=url,
@@ -236,12 +272,25 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
                 )
                 if result.success:
                     print(f"Successfully crawled: {url}")
-                    await process_and_store_document(url, result.markdown_v2.raw_markdown)
+                    pages[url] = result.markdown_v2.raw_markdown
                 else:
                     print(f"Failed: {url} - Error: {result.error_message}")
         
-        # Process all URLs in parallel with limited concurrency
-        await asyncio.gather(*[process_url(url) for url in urls])
+        # Crawl all URLs in parallel with limited concurrency
+        await asyncio.gather(*[crawl_url(url) for url in urls])
+
+        # Learn the repeated site chrome across every crawled page before cleaning
+        cleaner = BoilerplateCleaner()
+        for markdown in pages.values():
+            cleaner.observe(markdown)
+
+        async def process_page(url: str, markdown: str):
+            async with semaphore:
+                await process_and_store_document(url, markdown, cleaner)
+
+        await asyncio.gather(*[process_page(url, markdown) for url, markdown in pages.items()])
+        print(f"Boilerplate cleaning removed {cleaner.total_chars_removed} chars / "
+              f"{cleaner.total_tokens_removed} tokens across {len(pages)} pages")
     finally:
         await crawler.close()
 
@@ -264,6 +313,14 @@ def get_pydantic_ai_docs_urls() -> List[str]:
         print(f"Error fetching sitemap: {e}")
         return []
 
+def bump_index_version(source: str = "pydantic_ai_docs"):
+    """Bump the index version so agent-side retrieval caches drop results from before this ingest."""
+    try:
+        result = supabase.rpc("bump_site_pages_index_version", {"index_source": source}).execute()
+        print(f"Index version for {source} is now {result.data}")
+    except Exception as e:
+        print(f"Error bumping index version: {e}")
+
 async def cleanup_clients():
     """Clean up HTTP clients."""
     await http_client_chat.aclose()
@@ -279,6 +336,7 @@ async def main():
         
         print(f"Found {len(urls)} URLs to crawl")
         await crawl_parallel(urls)
+        bump_index_version()
     finally:
         # Clean up HTTP clients
         await cleanup_clients()
@@ -27,7 +27,9 @@ create index idx_site_pages_metadata on site_pages using gin (metadata);
 create function match_site_pages (
   query_embedding vector(1536),
   match_count int default 10,
-  filter jsonb DEFAULT '{}'::jsonb
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter varchar default null,
+  path_prefix varchar default null
 ) returns table (
   id bigint,
   url varchar,
@@ -54,11 +56,233 @@ begin
     1 - (site_pages.embedding <=> query_embedding) as similarity
   from site_pages
   where metadata @> filter
+    and (source_filter is null or source = source_filter)
+    and (path_prefix is null or url_path like path_prefix || '%')
   order by site_pages.embedding <=> query_embedding
   limit match_count;
 end;
 $$;
 
+-- Full-text search over title, summary and content for exact identifiers and error strings
+alter table site_pages add column fts tsvector
+  generated always as (
+    to_tsvector('english', coalesce(title, '') || ' ' || coalesce(summary, '') || ' ' || content)
+  ) stored;
+
+create index idx_site_pages_fts on site_pages using gin (fts);
+
+-- First-class columns for the filters every query applies, so they use btree indexes
+-- instead of jsonb paths. With a selective source or path prefix the planner can rank
+-- just the matching rows instead of post-filtering a scan over every source.
+alter table site_pages
+  add column source varchar,
+  add column url_path varchar,
+  add column crawled_at timestamp with time zone;
+
+-- Backfill chunks ingested before the columns existed
+update site_pages set
+  source = metadata->>'source',
+  url_path = metadata->>'url_path',
+  crawled_at = (metadata->>'crawled_at')::timestamptz
+where source is null;
+
+-- varchar_pattern_ops lets `url_path like '/prefix%'` use the index
+create index idx_site_pages_source_url_path on site_pages (source, url_path varchar_pattern_ops);
+
+create index idx_site_pages_source_crawled_at on site_pages (source, crawled_at);
+
+create function keyword_match_site_pages (
+  query_text text,
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter varchar default null,
+  path_prefix varchar default null
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  title varchar,
+  summary varchar,
+  content text,
+  metadata jsonb,
+  rank float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  return query
+  select
+    id,
+    url,
+    chunk_number,
+    title,
+    summary,
+    content,
+    metadata,
+    ts_rank_cd(site_pages.fts, websearch_to_tsquery('english', query_text))::float as rank
+  from site_pages
+  where metadata @> filter
+    and (source_filter is null or source = source_filter)
+    and (path_prefix is null or url_path like path_prefix || '%')
+    and site_pages.fts @@ websearch_to_tsquery('english', query_text)
+  order by rank desc
+  limit match_count;
+end;
+$$;
+
+-- One row per page, maintained at ingest time, so listing pages does not scan every chunk
+create table site_page_catalog (
+    url varchar primary key,
+    source varchar not null,
+    url_path varchar,
+    title varchar not null,
+    chunk_count integer not null,
+    summary text,  -- page title plus the summaries of its chunks
+    summary_embedding vector(1536),  -- small page-level index used to route queries to pages
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create index idx_site_page_catalog_source on site_page_catalog (source, url_path varchar_pattern_ops);
+
+create index on site_page_catalog using hnsw (summary_embedding vector_cosine_ops);
+
+-- Backfill the catalog from chunks that were ingested before it existed
+insert into site_page_catalog (url, source, url_path, title, chunk_count)
+select
+  url,
+  metadata->>'source',
+  metadata->>'url_path',
+  split_part((array_agg(title order by chunk_number))[1], ' - ', 1),
+  count(*)
+from site_pages
+group by url, metadata->>'source', metadata->>'url_path'
+on conflict (url) do nothing;
+
+-- Two-stage retrieval, stage one: shortlist pages by their summary embedding
+create function match_page_summaries (
+  query_embedding vector(1536),
+  match_count int default 10,
+  source_filter varchar default null,
+  path_prefix varchar default null
+) returns table (
+  url varchar,
+  title varchar,
+  similarity float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  return query
+  select
+    url,
+    title,
+    1 - (site_page_catalog.summary_embedding <=> query_embedding) as similarity
+  from site_page_catalog
+  where summary_embedding is not null
+    and (source_filter is null or source = source_filter)
+    and (path_prefix is null or url_path like path_prefix || '%')
+  order by site_page_catalog.summary_embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+-- Two-stage retrieval, stage two: re-score only the chunks of the shortlisted pages
+create function match_site_pages_in_urls (
+  query_embedding vector(1536),
+  urls varchar[],
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter varchar default null,
+  path_prefix varchar default null
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  title varchar,
+  summary varchar,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  return query
+  select
+    id,
+    url,
+    chunk_number,
+    title,
+    summary,
+    content,
+    metadata,
+    1 - (site_pages.embedding <=> query_embedding) as similarity
+  from site_pages
+  where url = any(urls)
+    and metadata @> filter
+    and (source_filter is null or source = source_filter)
+  order by site_pages.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+-- Fetch windows of neighbouring chunks, e.g. [{"url": "...", "first_chunk": 2, "last_chunk": 6}],
+-- in one query using the (url, chunk_number) unique index
+create function get_site_page_windows (
+  windows jsonb,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter varchar default null
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  title varchar,
+  summary varchar,
+  content text,
+  metadata jsonb
+)
+language sql
+as $$
+  select
+    p.id,
+    p.url,
+    p.chunk_number,
+    p.title,
+    p.summary,
+    p.content,
+    p.metadata
+  from site_pages p
+  join jsonb_to_recordset(windows) as w(url varchar, first_chunk int, last_chunk int)
+    on p.url = w.url
+   and p.chunk_number between w.first_chunk and w.last_chunk
+  where p.metadata @> filter
+    and (source_filter is null or p.source = source_filter)
+  order by p.url, p.chunk_number;
+$$;
+
+-- Track an index version per source so caches can expire entries after a re-ingest
+create table site_pages_index (
+    source varchar primary key,
+    version bigint not null default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create function bump_site_pages_index_version (
+  index_source varchar
+) returns bigint
+language sql
+as $$
+  insert into site_pages_index (source, version)
+  values (index_source, 1)
+  on conflict (source) do update
+    set version = site_pages_index.version + 1,
+        updated_at = timezone('utc'::text, now())
+  returning version;
+$$;
+
 -- Everything above will work for any PostgreSQL database. The below commands are for Supabase security
 
 -- Enable RLS on the table
@@ -69,4 +293,20 @@ create policy "Allow public read access"
   on site_pages
   for select
   to public
-  using (true);
\ No newline at end of file
+  using (true);
+
+alter table site_pages_index enable row level security;
+
+create policy "Allow public read access"
+  on site_pages_index
+  for select
+  to public
+  using (true);
+
+alter table site_page_catalog enable row level security;
+
+create policy "Allow public read access"
+  on site_page_catalog
+  for select
+  to public
+  using (true);
@@ -0,0 +1,54 @@
+"""Coalesce streamed text deltas into periodic Streamlit placeholder updates."""
+import time
+
+
+class ThrottledRenderer:
+    """
+    Accumulates streamed text and re-renders `placeholder` (anything with a
+    `markdown(text)` method, e.g. `st.empty()`) at most every
+    `interval_seconds`, or sooner once `min_chars` new characters are pending.
+    Re-rendering on every delta redraws the whole growing answer each time,
+    which is quadratic in its length.
+
+    Use it as a context manager so the final text is always rendered:
+
+        with ThrottledRenderer(st.empty()) as renderer:
+            async for delta in result.stream_text(delta=True):
+                renderer.append(delta)
+    """
+
+    def __init__(self, placeholder, interval_seconds: float = 0.1, min_chars: int = 400):
+        self.placeholder = placeholder
+        self.interval_seconds = interval_seconds
+        self.min_chars = min_chars
+        self.renders = 0
+        self._deltas = []
+        self._length = 0
+        self._rendered_length = 0
+        self._last_render = 0.0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._deltas)
+
+    def append(self, delta: str):
+        self._deltas.append(delta)
+        self._length += len(delta)
+        pending = self._length - self._rendered_length
+        if pending >= self.min_chars or time.monotonic() - self._last_render >= self.interval_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.renders and self._rendered_length == self._length:
+            return
+        self.placeholder.markdown(self.text)
+        self.renders += 1
+        self._rendered_length = self._length
+        self._last_render = time.monotonic()
+
+    def __enter__(self) -> "ThrottledRenderer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+        return False
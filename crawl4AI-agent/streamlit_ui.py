@@ -1,9 +1,9 @@
 # pyright: reportMissingImports=false
 
 from __future__ import annotations
-from typing import Literal, TypedDict
-import asyncio
+from typing import AsyncIterator, List, Literal, TypedDict
 import os
+import uuid
 
 import streamlit as st
 import logfire
@@ -11,21 +11,49 @@ from supabase import create_client, Client
 
 # We don't need to import the OpenAI client here anymore
 from pydantic_ai.messages import ModelRequest, ModelResponse, UserPromptPart, TextPart
-from ai_expert import pydantic_ai_expert, PydanticAIDeps
+from ai_expert import pydantic_ai_expert, PydanticAIDeps, start_site_pages_mirror, start_prefetch
+from prefetch import RetrievalPrefetcher
+from history_compaction import HistoryConfig, compact_history, history_tokens
+from stream_render import ThrottledRenderer
+from background_loop import BackgroundEventLoop
+from chat_store import ChatHistoryStore, chat_history_store_from_env
 
 # Load environment variables (this is now very important)
 from dotenv import load_dotenv
 load_dotenv()
 
-# We only need to initialize Supabase here
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+# Cached for the process so reruns reuse one client and its connection pool
+@st.cache_resource
+def get_supabase() -> Client:
+    supabase = create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_SERVICE_KEY")
+    )
+    # Build the optional in-process vector index mirror once per process
+    start_site_pages_mirror(supabase)
+    return supabase
+
+# Agent runs are submitted to one long-lived loop instead of asyncio.run on every rerun,
+# so the Azure OpenAI client keeps its connections between questions
+@st.cache_resource
+def get_event_loop() -> BackgroundEventLoop:
+    return BackgroundEventLoop(name="rag-agent-loop")
+
+# Conversations are persisted so they survive reloads and only recent turns are rendered
+@st.cache_resource
+def get_chat_store() -> ChatHistoryStore:
+    return chat_history_store_from_env()
+
+supabase: Client = get_supabase()
+chat_store = get_chat_store()
+history_page_turns = int(os.getenv("CHAT_HISTORY_PAGE_TURNS", "10"))
 
 # Configure logfire
 logfire.configure(send_to_logfire='never')
 
+# Old retrieved documentation is elided from the history sent with each new question
+history_config = HistoryConfig.from_env()
+
 # ... (ChatMessage and display_message_part functions are unchanged) ...
 class ChatMessage(TypedDict):
     role: Literal['user', 'model']
@@ -40,55 +68,97 @@ def display_message_part(part):
     elif part.part_kind == 'text':
         with st.chat_message("assistant"): st.markdown(part.content)
 
-async def run_agent_with_streaming(user_input: str):
-    """Run the agent and stream the response."""
-    # Prepare the simplified dependencies
-    deps = PydanticAIDeps(supabase=supabase)
+def conversation_id() -> str:
+    """Conversation id kept in the URL, so a reload or a shared link reopens the same chat."""
+    if "conversation" not in st.query_params:
+        st.query_params["conversation"] = uuid.uuid4().hex
+    return st.query_params["conversation"]
 
+def run_agent_with_streaming(user_input: str, conversation: str, turn: int, history: List):
+    """Run the agent on the background loop, stream the response into the chat and store the turn."""
+    # Prepare the simplified dependencies
+    deps = PydanticAIDeps(supabase=supabase, prefetcher=RetrievalPrefetcher(
+        similarity_threshold=float(os.getenv("PREFETCH_SIMILARITY", "0.9"))
+    ))
+
+    # The full transcript stays in the chat store; the model gets a bounded copy of the recent turns
+    message_history = compact_history(history, history_config)
+    logfire.info(
+        'compacted history: {tokens} tokens',
+        tokens=history_tokens(message_history),
+        tokens_before=history_tokens(history),
+        messages=len(message_history),
+    )
+
+    new_messages: List = []
+
+    async def run() -> AsyncIterator[str]:
+        # Start retrieval for the question right away instead of waiting a model turn for the tool call
+        start_prefetch(deps, user_input)
+        try:
+            async for chunk in stream_agent_response(user_input, deps, message_history, new_messages):
+                yield chunk
+        finally:
+            deps.prefetcher.cancel()
+
+    # Deltas are coalesced so long answers are not re-rendered once per token
+    with ThrottledRenderer(
+        st.empty(), interval_seconds=float(os.getenv("STREAM_RENDER_INTERVAL_SECONDS", "0.1"))
+    ) as renderer:
+        for chunk in get_event_loop().stream(run()):
+            renderer.append(chunk)
+
+    # Store the run's messages and the final response (from the script thread; the loop thread has no Streamlit context)
+    chat_store.append(conversation, turn, new_messages + [ModelResponse(parts=[TextPart(content=renderer.text)])])
+
+async def stream_agent_response(user_input: str, deps: PydanticAIDeps, message_history: List, new_messages: List):
+    """Yield the agent's answer as text deltas, then add the run's new messages to `new_messages`."""
     # The agent will create its own Azure client internally using the environment variables
     async with pydantic_ai_expert.run_stream(
         user_input,
         deps=deps,
-        message_history=st.session_state.messages[:-1],
+        message_history=message_history,
     ) as result:
-        partial_text = ""
-        message_placeholder = st.empty()
-
         async for chunk in result.stream_text(delta=True):
-            partial_text += chunk
-            message_placeholder.markdown(partial_text)
+            yield chunk
 
-        # Update session state
-        filtered_messages = [
+        new_messages.extend(
             msg for msg in result.new_messages()
             if not any(part.part_kind == 'user-prompt' for part in getattr(msg, 'parts', []))
-        ]
-        st.session_state.messages.extend(filtered_messages)
-
-        # Add final response
-        st.session_state.messages.append(
-            ModelResponse(parts=[TextPart(content=partial_text)])
         )
 
 # ... (main function is unchanged) ...
-async def main():
+def main():
     st.title("Google ADK Agentic RAG")
     st.write("Ask any question about Google ADK Documentation.")
 
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    conversation = conversation_id()
+    with st.sidebar:
+        if st.button("New conversation"):
+            st.query_params["conversation"] = conversation = uuid.uuid4().hex
+            st.session_state.history_turns = history_page_turns
+
+    # Only the most recent page of turns is loaded and rendered; older ones on request
+    if "history_turns" not in st.session_state:
+        st.session_state.history_turns = history_page_turns
+    last_turn = chat_store.last_turn(conversation)
+    if last_turn > st.session_state.history_turns and st.button("Show earlier messages"):
+        st.session_state.history_turns += history_page_turns
 
-    for msg in st.session_state.messages:
+    for msg in chat_store.recent_turns(conversation, st.session_state.history_turns):
         for part in getattr(msg, 'parts', []):
             display_message_part(part)
 
     user_input = st.chat_input("What questions do you have about Google ADK?")
 
     if user_input:
-        st.session_state.messages.append(ModelRequest(parts=[UserPromptPart(content=user_input)]))
+        history = chat_store.recent_turns(conversation, history_config.load_turns)
+        turn = last_turn + 1
+        # The question is stored right away so it is not lost if the run fails
+        chat_store.append(conversation, turn, [ModelRequest(parts=[UserPromptPart(content=user_input)])])
         with st.chat_message("user"): st.markdown(user_input)
         with st.chat_message("assistant"):
-            await run_agent_with_streaming(user_input)
+            run_agent_with_streaming(user_input, conversation, turn, history)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""Concurrency tests for the off-loop supabase data access used by the pydantic_ai_expert tools."""
+import asyncio
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+for name, value in {
+    "OPENAI_API_KEY": "test",
+    "CHAT_AZURE_OPENAI_ENDPOINT": "https://example.openai.azure.com",
+    "CHAT_AZURE_OPENAI_API_KEY": "test",
+    "MODEL_DEPLOYMENT_NAME": "test-model",
+    "EMBEDDING_DEPLOYMENT_NAME": "test-embedding",
+}.items():
+    os.environ.setdefault(name, value)
+
+from pydantic_ai.models.test import TestModel
+
+import ai_expert
+from data_access import SupabaseExecutor
+
+QUERY_DELAY_SECONDS = 0.2
+
+
+class SlowQuery:
+    """Stands in for a postgrest query builder whose execute() blocks like a real HTTP call."""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def __getattr__(self, attr):
+        # select/eq/order/gt/... just return the builder
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        with self.db.lock:
+            self.db.in_flight += 1
+            self.db.max_in_flight = max(self.db.max_in_flight, self.db.in_flight)
+        time.sleep(QUERY_DELAY_SECONDS)
+        with self.db.lock:
+            self.db.in_flight -= 1
+            self.db.executed += 1
+        return SimpleNamespace(data=self.db.responses.get(self.name, []))
+
+
+class SlowSupabase:
+    def __init__(self, responses):
+        self.responses = responses
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.executed = 0
+
+    def rpc(self, name, params):
+        return SlowQuery(self, name)
+
+    def from_(self, table):
+        return SlowQuery(self, table)
+
+
+EMBEDDING = [1.0] + [0.0] * 1535
+
+
+async def fake_query_embedding(user_query):
+    return EMBEDDING
+
+
+async def fake_query_embeddings(queries):
+    return [EMBEDDING for _ in queries]
+
+
+def test_agent_runs_progress_in_parallel(monkeypatch):
+    chunk = {
+        'id': 1, 'url': 'https://example.com/a', 'chunk_number': 0, 'title': 'A - Docs', 'content': 'Agent docs',
+        'embedding': json.dumps(EMBEDDING),
+    }
+    supabase = SlowSupabase({
+        'match_site_pages': [chunk],
+        'keyword_match_site_pages': [chunk],
+        'site_pages': [chunk],
+        'site_page_catalog': [{'url': chunk['url']}],
+    })
+    monkeypatch.setattr(ai_expert, 'get_query_embedding', fake_query_embedding)
+    monkeypatch.setattr(ai_expert, 'get_query_embeddings', fake_query_embeddings)
+    deps = ai_expert.PydanticAIDeps(supabase=supabase)
+    runs = 4
+
+    async def run_all():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        with ai_expert.pydantic_ai_expert.override(model=TestModel()):
+            await asyncio.gather(*[ai_expert.pydantic_ai_expert.run('How do I build an agent?', deps=deps) for _ in range(runs)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ticker
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(run_all())
+
+    # Queries from different runs overlapped instead of queueing behind each other
+    assert supabase.max_in_flight > 1
+    # The event loop kept running while queries were blocked in worker threads
+    assert ticks >= int(elapsed / 0.01) // 2
+    # Run back to back, the blocking queries alone would take executed * delay
+    assert elapsed < supabase.executed * QUERY_DELAY_SECONDS * 0.75
+
+
+def test_executor_times_out_slow_queries():
+    executor = SupabaseExecutor(max_workers=1, timeout_seconds=0.05)
+    db = SlowSupabase({})
+
+    async def run():
+        await executor.execute(db.from_('site_pages').select('url'))
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+    executor.shutdown()
@@ -1,16 +1,70 @@
 from google.adk.agents.llm_agent import Agent
-from ..utils.db_connector import DatabaseConnector
-from ..utils.schema_inspector import SchemaInspector
+from google.adk.tools.tool_context import ToolContext
+from ..utils.db_connector import QueryCancellation, pool_options_from_env
+from ..utils.schema_cache import SchemaCache
+from ..utils.connector_registry import ConnectorRegistry
+from ..utils.query_cache import QueryResultCache, referenced_tables
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import os
+import threading
+import time
+
+# Session key used when the caller does not pass one (scripts, verify_setup.py)
+DEFAULT_SESSION = "default"
+
+# Schema metadata is cached per database across questions (and reconnects to the same database)
+schema_cache = SchemaCache(
+    ttl_seconds=float(os.getenv("SCHEMA_CACHE_TTL_SECONDS", "600")),
+    fingerprint_interval_seconds=float(os.getenv("SCHEMA_FINGERPRINT_SECONDS", "0")),
+)
+
+# One connector and connection pool per UI session, so concurrent users don't overwrite each other
+connectors = ConnectorRegistry(
+    pool_options=pool_options_from_env(),
+    schema_cache=schema_cache,
+    idle_seconds=float(os.getenv("DB_SESSION_IDLE_SECONDS", "1800")),
+)
 
-# Global connector instance (for simplicity in this demo)
-# In a real app, this would be managed per session/user
-db_connector = None
-schema_inspector = None
+# Only a capped preview of each result is fetched and shown to the model
+query_max_rows = int(os.getenv("QUERY_MAX_ROWS", "200"))
+query_max_bytes = int(os.getenv("QUERY_MAX_BYTES", "1000000"))
+query_chunk_rows = int(os.getenv("QUERY_CHUNK_ROWS", "1000"))
+query_count_timeout_ms = int(os.getenv("QUERY_COUNT_TIMEOUT_MS", "2000"))
+# Bounds on the text the model sees: long cell values are shortened, and the whole table is cut off
+query_max_colwidth = int(os.getenv("QUERY_MAX_COLWIDTH", "200"))
+query_max_chars = int(os.getenv("QUERY_MAX_CHARS", "20000"))
 
-def init_db_connection(config):
-    global db_connector, schema_inspector
-    db_connector = DatabaseConnector(
+# Results of repeated queries are served from memory (or the spill directory) until they expire
+query_cache = QueryResultCache(
+    ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300")),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", "100000000")),
+    spill_dir=os.getenv("QUERY_CACHE_SPILL_DIR") or None,
+)
+
+# Blocking database and BigQuery calls run on this bounded pool, so a slow query
+# doesn't stall the event loop that every other session's agent runs on
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_TOOL_WORKERS", "8")), thread_name_prefix="db-tool"
+)
+
+async def run_blocking(func, *args, cancellation: QueryCancellation = None):
+    """
+    Runs `func(*args)` on the database thread pool. If the awaiting task is cancelled
+    (the agent run was abandoned), the running query is cancelled too.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(db_executor, functools.partial(func, *args))
+    except asyncio.CancelledError:
+        if cancellation is not None:
+            cancellation.cancel()
+        raise
+
+def init_db_connection(config, session_key: str = DEFAULT_SESSION):
+    connectors.connect(
+        session_key,
         db_type=config.get('type', 'postgresql'),
         user=config.get('user'),
         password=config.get('password'),
@@ -20,35 +74,127 @@ def init_db_connection(config):
         project_id=config.get('project_id'), # For BigQuery
         dataset_id=config.get('dataset_id')  # For BigQuery
     )
-    schema_inspector = SchemaInspector(db_connector)
 
-def list_tables() -> list:
+def close_db_connection(session_key: str = DEFAULT_SESSION):
+    connectors.disconnect(session_key)
+
+def _session_connector(tool_context: ToolContext = None):
+    """The (connector, inspector) of the session this tool call belongs to."""
+    session_key = DEFAULT_SESSION
+    if tool_context is not None:
+        session_key = tool_context.state.get("db_session", DEFAULT_SESSION)
+    return connectors.get(session_key)
+
+async def list_tables(tool_context: ToolContext) -> list:
     """Lists all tables in the connected database."""
+    _, schema_inspector = _session_connector(tool_context)
     if schema_inspector:
-        return schema_inspector.get_all_tables()
+        return await run_blocking(schema_inspector.get_all_tables)
     return []
 
-def get_schema(table_name: str) -> str:
+async def get_schema(table_name: str, tool_context: ToolContext) -> str:
     """Gets the schema for a specific table."""
+    _, schema_inspector = _session_connector(tool_context)
     if schema_inspector:
-        df = schema_inspector.get_table_schema(table_name)
+        df = await run_blocking(schema_inspector.get_table_schema, table_name)
         return df.to_string()
     return "Database not connected."
 
-def execute_sql(query: str) -> str:
+async def describe_database(tool_context: ToolContext) -> str:
+    """Describes every table with its columns, types, primary keys and foreign keys in one call."""
+    _, schema_inspector = _session_connector(tool_context)
+    if schema_inspector:
+        return await run_blocking(schema_inspector.get_formatted_schema) or "No tables found."
+    return "Database not connected."
+
+async def refresh_schema(tool_context: ToolContext) -> str:
+    """Clears the cached table list and schemas, e.g. after tables were created or altered."""
+    _, schema_inspector = _session_connector(tool_context)
+    if schema_inspector:
+        schema_inspector.refresh()
+        tables = await run_blocking(schema_inspector.get_all_tables)
+        return f"Schema cache cleared. {len(tables)} tables found."
+    return "Database not connected."
+
+async def execute_sql(query: str, tool_context: ToolContext) -> str:
     """Executes a SQL query and returns the results as a string."""
+    db_connector, _ = _session_connector(tool_context)
     if db_connector:
         try:
             # Basic safety check (should be more robust in production)
             if "drop" in query.lower() or "delete" in query.lower() or "update" in query.lower():
                 return "Error: Destructive queries are not allowed."
             
-            df = db_connector.execute_query(query)
-            return df.to_string() # Return string representation for the agent
+            cancellation = QueryCancellation()
+            return await run_blocking(run_query, db_connector, query, cancellation, cancellation=cancellation)
         except Exception as e:
             return f"Error executing query: {str(e)}"
     return "Database not connected."
 
+def run_query(db_connector, query: str, cancellation: QueryCancellation = None) -> str:
+    """
+    Runs a query (or serves it from the query cache) and formats the capped result.
+    Blocking; execute_sql runs it on the database thread pool.
+    """
+    # The preview depends on the caps and on the data read, so they are part of the cache key
+    fold = db_connector.folds_identifiers
+    params = (query_max_rows, query_max_bytes)
+    if query_cache.enabled:
+        params += (db_connector.data_version(referenced_tables(query, fold)),)
+    cached = query_cache.get(db_connector.connection_key, query, params, fold)
+    if cached is not None:
+        df, total_rows, truncated, cached_at = cached
+        return format_query_result(df, total_rows, truncated, cached_at=cached_at)
+
+    df, total_rows, truncated = db_connector.execute_query_preview(
+        query,
+        max_rows=query_max_rows,
+        max_bytes=query_max_bytes,
+        chunksize=query_chunk_rows,
+        count_timeout_ms=query_count_timeout_ms,
+        cancellation=cancellation,
+    )
+    query_cache.put(db_connector.connection_key, query, df, total_rows, truncated, params, fold)
+    return format_query_result(df, total_rows, truncated)
+
+def clear_query_cache(table_name: str, tool_context: ToolContext) -> str:
+    """
+    Drops cached query results that read `table_name`, so the next query re-reads the data.
+    Pass an empty string to drop every cached result of this database.
+    """
+    db_connector, _ = _session_connector(tool_context)
+    if db_connector:
+        if table_name:
+            dropped = query_cache.invalidate_tables(db_connector.connection_key, [table_name])
+        else:
+            dropped = query_cache.invalidate(db_connector.connection_key)
+        return f"Dropped {dropped} cached results."
+    return "Database not connected."
+
+def format_query_result(df, total_rows, truncated, cached_at=None) -> str:
+    """String representation of a (possibly capped) result for the agent."""
+    result = df.to_string(max_colwidth=query_max_colwidth)
+    if len(result) > query_max_chars:
+        cut = result.rfind("\n", 0, query_max_chars)
+        shown_rows = result.count("\n", 0, cut) if cut > 0 else 0
+        result = result[:cut if cut > 0 else query_max_chars]
+        result += (
+            f"\n\n[Output cut to {query_max_chars} characters ({shown_rows} of {len(df)} fetched rows shown). "
+            "Select fewer or narrower columns.]"
+        )
+    if cached_at is not None:
+        result += (
+            f"\n\n[Cached result from {int(time.time() - cached_at)} seconds ago. "
+            "Call `clear_query_cache` if the data may have changed since.]"
+        )
+    if truncated:
+        total = f"{total_rows} rows" if total_rows is not None else "more rows"
+        result += (
+            f"\n\n[Showing the first {len(df)} of {total}. "
+            "Use aggregation, filters or LIMIT to get a smaller result.]"
+        )
+    return result
+
 def create_agent(api_key: str = None):
     """
     Creates and configures the Data Analysis Agent.
@@ -65,72 +211,140 @@ def create_agent(api_key: str = None):
         
         Workflow:
         1. Understand the user's question.
-        2. Use `list_tables` to see what tables are available.
-        3. Use `get_schema` to understand the columns of relevant tables.
+        2. Use `describe_database` to see all tables, columns and keys at once
+           (or `list_tables` and `get_schema` for a single table).
+        3. Use the primary and foreign keys to decide how to join tables.
         4. Construct a valid SQL query (read-only).
         5. Use `execute_sql` to run the query.
         6. Analyze the results and provide an answer.
         
+        Table lists and schemas are cached. If a table or column seems to be missing,
+        or the user says the schema changed, call `refresh_schema` and look again.
+        
+        Results of repeated queries are cached and marked as such. If the user says the
+        data changed, call `clear_query_cache` for the affected table before querying again.
+        
         Always ensure your SQL queries are safe and read-only.
         If the result is large, summarize it.
+        Results are capped to a preview; when a result says it shows only the first rows,
+        rewrite the query with aggregation or filters instead of asking for all rows.
         """,
-        tools=[list_tables, get_schema, execute_sql],
+        tools=[list_tables, get_schema, describe_database, refresh_schema, execute_sql, clear_query_cache],
     )
     return agent
 
-import asyncio
+from typing import Callable, Optional
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.sessions.in_memory_session_service import InMemorySessionService
 from google.genai import types
 
 # Global runner instance
-runner = None
 session_service = InMemorySessionService()
 app_name = "data_analysis_agent"
 
-def run_agent(agent, prompt: str) -> str:
+# One Runner per agent, so sessions using different agents (e.g. API keys) don't rebuild
+# each other's runner or swap it out from under a run in progress
+_runners = {}  # id(agent) -> (agent, runner); holding the agent keeps its id from being reused
+_runners_lock = threading.Lock()
+
+def get_runner(agent) -> Runner:
+    """Returns the Runner for `agent`, creating it on first use."""
+    with _runners_lock:
+        entry = _runners.get(id(agent))
+        if entry is None:
+            entry = (agent, Runner(agent=agent, session_service=session_service, app_name=app_name))
+            _runners[id(agent)] = entry
+        return entry[1]
+
+async def run_agent_events(agent, prompt: str, streaming: bool = False, session_id: str = DEFAULT_SESSION):
     """
-    Synchronously runs the agent with the given prompt using the ADK Runner.
+    Runs the agent with the given prompt using the ADK Runner, yielding ("delta", text)
+    for streamed partial text and ("final", text) for the final response.
+
+    `session_id` also selects the database connection the tools use (see init_db_connection).
     """
-    global runner
-    if runner is None:
-        runner = Runner(agent=agent, session_service=session_service, app_name=app_name)
-
-    async def _run():
-        # Ensure session exists
-        user_id = "demo_user"
-        session_id = "demo_session"
-        
-        try:
-            await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        except Exception:
-            # Session might not exist, try creating it
-            # Note: get_session usually returns None if not found, but let's be safe
-            pass
-            
-        # Check if session actually exists, if not create it
-        session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        if not session:
-             await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
-
-        # Create a simple text content for the user message
-        user_content = types.Content(
-            role="user",
-            parts=[types.Part(text=prompt)]
-        )
+    runner = get_runner(agent)
+
+    # Ensure session exists
+    user_id = "demo_user"
+    
+    try:
+        await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    except Exception:
+        # Session might not exist, try creating it
+        # Note: get_session usually returns None if not found, but let's be safe
+        pass
         
-        response_text = ""
-        # Use a fixed session/user ID for this demo
-        async for event in runner.run_async(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=user_content
-        ):
-            # Capture the final response from the agent
-            if event.is_final_response() and event.content:
-                 for part in event.content.parts:
-                     if part.text:
-                         response_text += part.text
-        return response_text
-
-    return asyncio.run(_run())
+    # Check if session actually exists, if not create it
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if not session:
+         await session_service.create_session(
+             app_name=app_name, user_id=user_id, session_id=session_id, state={"db_session": session_id}
+         )
+
+    # Create a simple text content for the user message
+    user_content = types.Content(
+        role="user",
+        parts=[types.Part(text=prompt)]
+    )
+    
+    # With SSE streaming the text arrives as partial events, followed by the aggregated final event
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+    async for event in runner.run_async(
+        user_id=user_id,
+        session_id=session_id,
+        new_message=user_content,
+        run_config=run_config
+    ):
+        if not event.content:
+            continue
+        if event.partial:
+            for part in event.content.parts:
+                if part.text:
+                    yield "delta", part.text
+        # Capture the final response from the agent
+        elif event.is_final_response():
+             for part in event.content.parts:
+                 if part.text:
+                     yield "final", part.text
+
+def run_agent(
+    agent,
+    prompt: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    loop=None,
+    session_id: str = DEFAULT_SESSION,
+    on_idle: Optional[Callable[[float], None]] = None,
+) -> str:
+    """
+    Synchronously runs the agent with the given prompt and returns the final response.
+    If `on_delta` is given, the response is streamed and each text delta is passed to it.
+
+    `loop` is a long-lived background event loop (utils/background_loop.py) to run
+    on, so the model client keeps its connections between prompts; without one a new event
+    loop is created for this call and deltas are only delivered once the run is over.
+
+    `session_id` keys both the conversation and the database connection made with
+    `init_db_connection(config, session_id)`.
+
+    With a `loop`, `on_idle` is called with the elapsed seconds while nothing has
+    arrived for a while (e.g. during a long query); an exception it raises abandons
+    the run and cancels its query.
+    """
+    events = run_agent_events(agent, prompt, streaming=on_delta is not None, session_id=session_id)
+    if loop is not None:
+        # Items are handed back to this thread, so on_delta can safely update the UI
+        items = loop.stream(events, on_idle=on_idle)
+    else:
+        async def collect():
+            return [item async for item in events]
+        items = asyncio.run(collect())
+
+    response_text = ""
+    for kind, text in items:
+        if kind == "delta":
+            on_delta(text)
+        else:
+            response_text += text
+    return response_text
@@ -1,12 +1,17 @@
 import streamlit as st
 import sys
 import os
+import uuid
 
 # Add the current directory to sys.path to allow imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
 
-from data_analysis_agent.agent.agent import create_agent, init_db_connection, run_agent
+from data_analysis_agent.agent.agent import (
+    connectors, create_agent, init_db_connection, close_db_connection, run_agent
+)
+from data_analysis_agent.utils.stream_render import ThrottledRenderer
+from data_analysis_agent.utils.background_loop import BackgroundEventLoop
 
 st.set_page_config(
     page_title="Data Analysis Agent",
@@ -15,8 +20,23 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# One event loop for the life of the server process; agent runs are submitted to it
+@st.cache_resource
+def get_event_loop() -> BackgroundEventLoop:
+    return BackgroundEventLoop(name="data-analysis-agent-loop")
+
+# Agents (and the model client they hold) are reused across reruns and sessions with the same key
+@st.cache_resource
+def get_agent(api_key: str):
+    return create_agent(api_key=api_key)
+
 def main():
     st.title("📊 Data Analysis Agent")
+
+    # Each browser session gets its own database connection and agent session
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    session_id = st.session_state.session_id
     
     # Sidebar
     with st.sidebar:
@@ -26,7 +46,7 @@ def main():
         
         # Initialize Agent if API key is provided and agent not set
         if api_key and "agent" not in st.session_state:
-             st.session_state.agent = create_agent(api_key=api_key)
+             st.session_state.agent = get_agent(api_key)
         elif "agent" not in st.session_state:
              st.warning("Please enter your Google API Key to start.")
 
@@ -48,10 +68,17 @@ def main():
             
             if st.button("Connect"):
                 try:
-                    init_db_connection(config)
+                    init_db_connection(config, session_id)
                     st.success("Connected to database!")
                 except Exception as e:
                     st.error(f"Connection failed: {str(e)}")
+
+            if st.button("Disconnect"):
+                close_db_connection(session_id)
+                st.info("Disconnected.")
+
+        with st.expander("Connection Pool"):
+            st.json(connectors.metrics().get(session_id, {}))
             
         if st.button("Clear Chat History"):
             st.session_state.messages = []
@@ -72,13 +99,25 @@ def main():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("Thinking...")
+            renderer = ThrottledRenderer(message_placeholder)
+            status_placeholder = st.empty()
             
             try:
-                # Invoke the agent using the synchronous wrapper
-                response = run_agent(st.session_state.agent, prompt)
+                # Invoke the agent using the synchronous wrapper, rendering streamed text as it arrives.
+                # The elapsed-time status is redrawn while waiting, which is where Streamlit stops
+                # the script when the user presses Stop; the run and its query are then cancelled.
+                response = run_agent(
+                    st.session_state.agent,
+                    prompt,
+                    on_delta=renderer.append,
+                    loop=get_event_loop(),
+                    session_id=session_id,
+                    on_idle=lambda elapsed: status_placeholder.caption(f"Working... {elapsed:.0f}s"),
+                )
             except Exception as e:
                 response = f"Error invoking agent: {str(e)}\n\n(Ensure database is connected and agent is initialized)"
 
+            status_placeholder.empty()
             message_placeholder.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
 
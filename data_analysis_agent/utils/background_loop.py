@@ -0,0 +1,87 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+_DONE = object()
+
+
+class BackgroundEventLoop:
+    """
+    Runs one event loop for the life of the process, so async clients (HTTP
+    connection pools, TLS sessions) and caches keyed to a loop survive across
+    Streamlit reruns instead of being rebuilt by `asyncio.run` each time.
+
+    Coroutines run on the loop thread, so they must not call Streamlit
+    directly; `stream` hands their results back to the calling thread.
+    """
+
+    def __init__(self, name: str = "background-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run `coro` on the loop and block the calling thread until it finishes."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Interrupted (e.g. a Streamlit rerun) or timed out: don't leave the coroutine running
+            future.cancel()
+            raise
+
+    def stream(
+        self,
+        items: AsyncIterator[Any],
+        on_idle: Optional[Callable[[float], None]] = None,
+        idle_seconds: float = 0.5,
+    ) -> Iterator[Any]:
+        """
+        Iterate an async generator on the loop, yielding its items in the calling
+        thread as they are produced. Closing the iterator early cancels the generator.
+
+        While no item arrives, `on_idle` is called every `idle_seconds` with the seconds
+        elapsed so far. An exception it raises (e.g. Streamlit stopping the script when
+        the user presses Stop) ends the stream and cancels the generator.
+        """
+        results: "queue.Queue" = queue.Queue()
+        started = time.monotonic()
+
+        async def pump():
+            try:
+                async for item in items:
+                    results.put((item, None))
+            except BaseException as e:
+                results.put((_DONE, e))
+                raise
+            results.put((_DONE, None))
+
+        future = self.submit(pump())
+        try:
+            while True:
+                try:
+                    item, error = results.get(timeout=idle_seconds if on_idle is not None else None)
+                except queue.Empty:
+                    on_idle(time.monotonic() - started)
+                    continue
+                if item is _DONE:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
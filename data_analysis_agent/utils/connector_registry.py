@@ -0,0 +1,77 @@
+import threading
+import time
+
+from .db_connector import DatabaseConnector
+from .schema_inspector import SchemaInspector
+
+
+class ConnectorRegistry:
+    """
+    Keeps one DatabaseConnector (and SchemaInspector) per session or tenant key,
+    so concurrent users each get their own connection settings and pool.
+
+    Connectors unused for `idle_seconds` are disposed the next time anyone connects.
+    """
+
+    def __init__(self, pool_options=None, schema_cache=None, idle_seconds=1800):
+        self.pool_options = pool_options or {}
+        self.schema_cache = schema_cache
+        self.idle_seconds = idle_seconds
+        self._entries = {}  # key -> [connector, inspector, last_used]
+        self._lock = threading.Lock()
+
+    def connect(self, key, db_type, **config):
+        """
+        Creates a connector for `key`, disposing any connector it replaces.
+        """
+        connector = DatabaseConnector(db_type=db_type, pool_options=self.pool_options, **config)
+        inspector = SchemaInspector(connector, cache=self.schema_cache)
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = [connector, inspector, time.monotonic()]
+        if previous is not None:
+            previous[0].dispose()
+        self.close_idle()
+        return connector
+
+    def get(self, key):
+        """
+        Returns (connector, inspector) for `key`, or (None, None) if it is not connected.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            entry[2] = time.monotonic()
+            return entry[0], entry[1]
+
+    def disconnect(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[0].dispose()
+
+    def close_idle(self):
+        if self.idle_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if entry[2] < cutoff]
+            entries = [self._entries.pop(key) for key in idle]
+        for entry in entries:
+            entry[0].dispose()
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry[0].dispose()
+
+    def metrics(self):
+        """
+        Pool metrics per connected key.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        return {key: entry[0].pool_metrics() for key, entry in entries}
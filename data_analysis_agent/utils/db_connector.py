@@ -1,12 +1,72 @@
 import os
-from sqlalchemy import create_engine, text
+import threading
+from sqlalchemy import create_engine, event, text
 from google.cloud import bigquery
 import pandas as pd
 
+def pool_options_from_env():
+    """
+    Connection pool and timeout settings for DatabaseConnector, read from the environment.
+    """
+    timeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+    return {
+        'pool_size': int(os.getenv("DB_POOL_SIZE", "5")),
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        'pool_timeout': float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+        'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        'statement_timeout_ms': int(timeout) if timeout else None,
+    }
+
+class QueryCancellation:
+    """
+    Lets another thread cancel a query running in DatabaseConnector.execute_query_preview,
+    e.g. when the agent run that started it is abandoned.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._cancel_running = None
+        self._lock = threading.Lock()
+
+    def bind(self, cancel_running):
+        """Registers how to cancel the statement now running; runs it at once if already cancelled."""
+        with self._lock:
+            self._cancel_running = cancel_running
+            cancelled = self.cancelled
+        if cancelled:
+            self._call(cancel_running)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            cancel_running = self._cancel_running
+        if cancel_running is not None:
+            self._call(cancel_running)
+
+    def check(self):
+        if self.cancelled:
+            raise RuntimeError("Query cancelled")
+
+    def iterate(self, items):
+        """Yields from `items`, stopping with an error once cancelled."""
+        for item in items:
+            self.check()
+            yield item
+
+    def _call(self, cancel_running):
+        try:
+            cancel_running()
+        except Exception as e:
+            print(f"Error cancelling query: {e}")
+
 class DatabaseConnector:
-    def __init__(self, db_type, **kwargs):
+    def __init__(self, db_type, pool_options=None, **kwargs):
         self.db_type = db_type.lower()
         self.config = kwargs
+        # Pool sizing, pre-ping, recycle and statement timeout (see pool_options_from_env)
+        self.pool_options = dict(pool_options or {})
+        self.statement_timeout_ms = self.pool_options.pop('statement_timeout_ms', None)
         self.engine = None
         self.client = None
         self._connect()
@@ -19,7 +79,10 @@ class DatabaseConnector:
             port = self.config.get('port', '5432')
             dbname = self.config.get('dbname')
             url = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
-            self.engine = create_engine(url)
+            connect_args = {}
+            if self.statement_timeout_ms:
+                connect_args['options'] = f"-c statement_timeout={self.statement_timeout_ms}"
+            self.engine = create_engine(url, connect_args=connect_args, **self.pool_options)
             
         elif self.db_type == 'mysql':
             user = self.config.get('user')
@@ -28,7 +91,16 @@ class DatabaseConnector:
             port = self.config.get('port', '3306')
             dbname = self.config.get('dbname')
             url = f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{dbname}"
-            self.engine = create_engine(url)
+            self.engine = create_engine(url, **self.pool_options)
+            if self.statement_timeout_ms:
+                timeout_ms = int(self.statement_timeout_ms)
+
+                @event.listens_for(self.engine, "connect")
+                def _set_statement_timeout(dbapi_connection, connection_record):
+                    # Applies to read-only SELECT statements, which is all the agent runs
+                    cursor = dbapi_connection.cursor()
+                    cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {timeout_ms}")
+                    cursor.close()
             
         elif self.db_type == 'bigquery':
             # Assumes GOOGLE_APPLICATION_CREDENTIALS is set or using default auth
@@ -37,6 +109,77 @@ class DatabaseConnector:
         else:
             raise ValueError(f"Unsupported database type: {self.db_type}")
 
+    @property
+    def connection_key(self):
+        """
+        Identifies the database this connector points at (without credentials),
+        so caches can be shared across reconnects to the same database.
+        """
+        if self.db_type == 'bigquery':
+            return f"bigquery://{self.config.get('project_id')}/{self.config.get('dataset_id')}"
+        return (
+            f"{self.db_type}://{self.config.get('user')}@{self.config.get('host')}:"
+            f"{self.config.get('port')}/{self.config.get('dbname')}"
+        )
+
+    @property
+    def folds_identifiers(self):
+        """
+        Whether unquoted table names are case-insensitive: PostgreSQL folds them to
+        lowercase, while MySQL (on Linux) and BigQuery keep their case.
+        """
+        return self.db_type == 'postgresql'
+
+    def data_version(self, tables):
+        """
+        A cheap marker that changes when rows of `tables` are written, read from
+        catalog statistics rather than the tables themselves. Returns None when it
+        can't be determined, so callers fall back to time-based expiry.
+
+        PostgreSQL reports statistics with a short delay, so a write is seen after
+        up to about a second.
+        """
+        tables = sorted(tables)
+        if not tables:
+            return None
+        try:
+            if self.db_type == 'postgresql':
+                query = text("""
+                    SELECT schemaname, relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup
+                    FROM pg_stat_user_tables
+                    WHERE relname = ANY(:tables)
+                    ORDER BY schemaname, relname
+                """)
+                with self.engine.connect() as connection:
+                    return tuple(tuple(row) for row in connection.execute(query, {'tables': tables}))
+            elif self.db_type == 'mysql':
+                names = ", ".join(f":t{i}" for i in range(len(tables)))
+                query = text(f"""
+                    SELECT TABLE_NAME, UPDATE_TIME, TABLE_ROWS
+                    FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({names})
+                    ORDER BY TABLE_NAME
+                """)
+                with self.engine.connect() as connection:
+                    # Otherwise MySQL 8 serves these columns from a cache refreshed once a day
+                    connection.execute(text("SET SESSION information_schema_stats_expiry = 0"))
+                    rows = connection.execute(query, {f"t{i}": table for i, table in enumerate(tables)})
+                    return tuple((row[0], str(row[1]), row[2]) for row in rows)
+            elif self.db_type == 'bigquery':
+                dataset = f"{self.config.get('project_id')}.{self.config.get('dataset_id')}"
+                version = []
+                for table in tables:
+                    try:
+                        modified = self.client.get_table(f"{dataset}.{table}").modified
+                    except Exception:
+                        # Not in the default dataset (or a CTE name); expiry covers it
+                        modified = None
+                    version.append((table, str(modified)))
+                return tuple(version)
+        except Exception as e:
+            print(f"Error reading data version: {e}")
+        return None
+
     def execute_query(self, query):
         """
         Executes a SQL query and returns the result as a Pandas DataFrame.
@@ -46,15 +189,170 @@ class DatabaseConnector:
                 return pd.read_sql(text(query), connection)
                 
         elif self.db_type == 'bigquery':
-            query_job = self.client.query(query)
+            job_config = None
+            if self.statement_timeout_ms:
+                job_config = bigquery.QueryJobConfig(job_timeout_ms=self.statement_timeout_ms)
+            query_job = self.client.query(query, job_config=job_config)
             return query_job.to_dataframe()
             
         else:
             raise ValueError("Database not connected")
 
+    def execute_query_preview(
+        self, query, max_rows=200, max_bytes=1_000_000, chunksize=1000, count_timeout_ms=2000, cancellation=None
+    ):
+        """
+        Executes a SQL query, streaming the result in chunks and keeping at most
+        `max_rows` rows and roughly `max_bytes` of DataFrame memory.
+
+        Returns (preview DataFrame, total row count or None if unknown, truncated flag).
+        When the result is cut off, the total is counted on the server only if that
+        finishes within `count_timeout_ms` (0 skips the count).
+        `cancellation` (a QueryCancellation) can stop the query from another thread.
+        """
+        cancellation = cancellation or QueryCancellation()
+        if self.db_type in ['postgresql', 'mysql']:
+            preview_query = query
+            if self.db_type == 'mysql':
+                # mysql-connector has no server-side cursors and buffers the whole result, so
+                # the cap is applied on the server. With the derived table as the only source,
+                # MySQL keeps its ORDER BY.
+                preview_query = (
+                    f"SELECT * FROM ({query.strip().rstrip(';')}) AS preview LIMIT {int(max_rows) + 1}"
+                )
+            # On PostgreSQL stream_results uses a server-side cursor, so rows past the cap are never fetched
+            with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as connection:
+                cancellation.bind(self._statement_canceller(connection))
+                cancellation.check()
+                result = connection.execute(text(preview_query))
+                columns = list(result.keys())
+                chunks = (
+                    pd.DataFrame(rows, columns=columns)
+                    for rows in cancellation.iterate(result.partitions(chunksize))
+                )
+                preview, rows_read, truncated = _take_preview(chunks, columns, max_rows, max_bytes)
+                result.close()
+            total = rows_read if not truncated else None
+            if truncated and count_timeout_ms:
+                total = self._count_rows(query, count_timeout_ms, cancellation)
+            return preview, total, truncated
+
+        elif self.db_type == 'bigquery':
+            job_config = None
+            if self.statement_timeout_ms:
+                job_config = bigquery.QueryJobConfig(job_timeout_ms=self.statement_timeout_ms)
+            cancellation.check()
+            query_job = self.client.query(query, job_config=job_config)
+            cancellation.bind(query_job.cancel)
+            # BigQuery reports the full row count for free; only the first pages are downloaded
+            rows = query_job.result(page_size=chunksize, max_results=max_rows + 1)
+            columns = [field.name for field in rows.schema]
+            chunks = cancellation.iterate(rows.to_dataframe_iterable())
+            preview, _, truncated = _take_preview(chunks, columns, max_rows, max_bytes)
+            return preview, rows.total_rows, truncated
+
+        else:
+            raise ValueError("Database not connected")
+
+    def _count_rows(self, query, timeout_ms, cancellation):
+        """
+        Counts the rows a query returns on the server, without transferring them.
+        The count gets its own short time limit, so an expensive query is not run
+        twice in full; returns None if it times out or fails.
+        """
+        timeout_ms = int(timeout_ms)
+        if self.statement_timeout_ms:
+            timeout_ms = min(timeout_ms, int(self.statement_timeout_ms))
+        subquery = query.strip().rstrip(';')
+        if self.db_type == 'mysql':
+            count_query = f"SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */ COUNT(*) FROM ({subquery}) AS counted_query"
+        else:
+            count_query = f"SELECT COUNT(*) FROM ({subquery}) AS counted_query"
+        try:
+            with self.engine.connect() as connection:
+                cancellation.bind(self._statement_canceller(connection))
+                cancellation.check()
+                with connection.begin():
+                    if self.db_type == 'postgresql':
+                        # Only lasts until the end of this transaction
+                        connection.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+                    return connection.execute(text(count_query)).scalar()
+        except Exception as e:
+            print(f"Skipping row count: {e}")
+            return None
+
+    def _statement_canceller(self, connection):
+        """
+        A callable that stops the statement running on `connection` from another thread.
+        """
+        dbapi_connection = connection.connection.dbapi_connection
+        if self.db_type == 'postgresql':
+            # psycopg2 sends a cancel request over a separate socket
+            return dbapi_connection.cancel
+        connection_id = dbapi_connection.connection_id
+
+        def kill_query():
+            # MySQL cancels a statement with KILL QUERY from another connection
+            with self.engine.connect() as killer:
+                killer.execute(text(f"KILL QUERY {int(connection_id)}"))
+        return kill_query
+
+    def pool_metrics(self):
+        """
+        Current connection pool usage, e.g. for display in the UI.
+        """
+        if self.engine is None:
+            return {}
+        pool = self.engine.pool
+        metrics = {'status': pool.status()}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            # QueuePool exposes these as methods; other pool classes may not have them
+            if callable(getattr(pool, name, None)):
+                metrics[name] = getattr(pool, name)()
+        return metrics
+
+    def dispose(self):
+        """
+        Closes every pooled connection (or the BigQuery client).
+        """
+        if self.engine is not None:
+            self.engine.dispose()
+        if self.client is not None:
+            self.client.close()
+
     def get_schema(self, table_name=None):
         """
         Returns schema information. Implementation depends on DB type.
         """
         # Placeholder for schema retrieval logic
         pass
+
+def _take_preview(chunks, columns, max_rows, max_bytes):
+    """
+    Concatenates DataFrame chunks until `max_rows` rows or about `max_bytes` are reached.
+    Returns (preview, rows read, truncated flag).
+    """
+    frames = []
+    rows = 0
+    size = 0
+    truncated = False
+    for chunk in chunks:
+        if rows + len(chunk) > max_rows:
+            chunk = chunk.iloc[:max_rows - rows]
+            truncated = True
+        chunk_bytes = int(chunk.memory_usage(deep=True).sum())
+        if max_bytes and size + chunk_bytes > max_bytes and len(chunk):
+            # Keep only as many rows of this chunk as fit in the remaining budget
+            fit = int((max_bytes - size) / (chunk_bytes / len(chunk)))
+            chunk = chunk.iloc[:max(fit, 0)]
+            chunk_bytes = int(chunk.memory_usage(deep=True).sum())
+            truncated = True
+        frames.append(chunk)
+        rows += len(chunk)
+        size += chunk_bytes
+        # A result of exactly max_rows rows reads one more (empty) chunk before it is known to be complete
+        if truncated:
+            break
+    if not frames:
+        return pd.DataFrame(columns=columns), 0, False
+    return pd.concat(frames, ignore_index=True), rows, truncated
@@ -0,0 +1,316 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+
+# String literals, quoted identifiers, comments, numbers, words and single symbols
+_TOKEN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<quoted>'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<symbol>\S)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Words lowercased even when identifiers keep their case
+_KEYWORDS = frozenset("""
+    all and any as asc avg between by case cast coalesce count cross current_date current_timestamp
+    desc distinct else end except exists extract false from full group having ilike in inner
+    intersect interval is join lateral left like limit max min natural not null nullif offset on
+    or order outer over partition qualify right rows select sum then true union unnest using
+    when where window with
+""".split())
+
+# Words that end a FROM list item, so they are not mistaken for a table alias
+_CLAUSE_WORDS = frozenset("""
+    where join inner left right full cross natural on using group order having limit offset
+    union except intersect window qualify for fetch lateral tablesample
+""".split())
+
+# Functions whose arguments use FROM without naming a table, e.g. EXTRACT(YEAR FROM ts)
+_FROM_FUNCTIONS = frozenset(["extract", "trim", "substring", "position", "overlay"])
+
+
+def _tokens(query):
+    return [
+        (match.lastgroup, match.group())
+        for match in _TOKEN.finditer(query)
+        if match.lastgroup != 'comment'
+    ]
+
+
+def normalize_sql(query, fold_identifiers=True):
+    """
+    Canonical form of a query for cache lookups: comments and trailing semicolons
+    are dropped, whitespace is collapsed, keywords are lowercased and numeric
+    literals are written in one form (`1.50` and `1.5` match). String literals and
+    quoted identifiers are kept as written, since they are case-sensitive.
+
+    Unquoted identifiers are lowercased too unless `fold_identifiers` is False,
+    for databases where table names are case-sensitive (MySQL on Linux, BigQuery).
+    """
+    tokens = []
+    for kind, value in _tokens(query):
+        if kind == 'word':
+            if fold_identifiers or value.lower() in _KEYWORDS:
+                value = value.lower()
+        elif kind == 'number':
+            try:
+                number = Decimal(value).normalize()
+                value = format(number, 'f') if number == number.to_integral_value() else str(number)
+            except InvalidOperation:
+                pass
+        tokens.append(value)
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def referenced_tables(query, fold_identifiers=True):
+    """
+    Unquoted names of the tables a query reads (last name part only), from every
+    FROM list (including comma joins) and JOIN. Unquoted names are lowercased
+    unless `fold_identifiers` is False. CTE names are included.
+    """
+    tokens = _tokens(query)
+    tables = set()
+    callers = []  # word before each open parenthesis
+    for i, (kind, value) in enumerate(tokens):
+        if value == '(':
+            callers.append(tokens[i - 1][1].lower() if i and tokens[i - 1][0] == 'word' else None)
+        elif value == ')':
+            if callers:
+                callers.pop()
+        elif kind == 'word' and value.lower() in ('from', 'join'):
+            if value.lower() == 'from' and callers and callers[-1] in _FROM_FUNCTIONS:
+                continue
+            tables.update(_table_list(tokens, i + 1, comma_list=value.lower() == 'from', fold_identifiers=fold_identifiers))
+    return tables
+
+
+def _table_list(tokens, i, comma_list, fold_identifiers):
+    """Table names in the FROM list (or single JOIN target) starting at token `i`."""
+    tables = []
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if value == '(':
+            # Subquery: its own FROM is found by the caller's scan
+            depth = 0
+            while i < len(tokens):
+                if tokens[i][1] == '(':
+                    depth += 1
+                elif tokens[i][1] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+        elif kind in ('word', 'quoted') and value.lower() not in _CLAUSE_WORDS:
+            # Schema- or project-qualified names, e.g. my-project.dataset.table
+            parts = [(kind, value)]
+            i += 1
+            while (
+                i + 1 < len(tokens) and tokens[i][1] in ('.', '-')
+                and tokens[i + 1][0] in ('word', 'quoted', 'number')
+            ):
+                parts.append(tokens[i + 1])
+                i += 2
+            if i < len(tokens) and tokens[i][1] == '(':
+                continue  # table function such as UNNEST(...)
+            last_kind, last = parts[-1]
+            name = last.strip('`"').split('.')[-1]
+            if last_kind == 'word' and fold_identifiers:
+                name = name.lower()
+            tables.append(name)
+        else:
+            break
+        # Optional alias
+        if i < len(tokens) and tokens[i][0] == 'word' and tokens[i][1].lower() == 'as':
+            i += 2
+        elif i < len(tokens) and tokens[i][0] in ('word', 'quoted') and tokens[i][1].lower() not in _CLAUSE_WORDS:
+            i += 1
+        if not (comma_list and i < len(tokens) and tokens[i][1] == ','):
+            break
+        i += 1
+    return tables
+
+
+class _CachedResult:
+    def __init__(self, df, total_rows, truncated, tables, ttl_seconds):
+        self.df = df  # None while the result only exists in its spill file
+        self.total_rows = total_rows
+        self.truncated = truncated
+        self.tables = tables
+        self.created_at = time.time()
+        self.expires_at = time.monotonic() + ttl_seconds
+        self.size = int(df.memory_usage(deep=True).sum())
+        self.spill_path = None
+
+
+class QueryResultCache:
+    """
+    LRU cache of query results keyed by connection and normalized SQL, with a
+    TTL and a bound on the total DataFrame memory held. Callers put the version of
+    the data read (DatabaseConnector.data_version) in `params`, so a write to one
+    of the tables makes the next lookup miss before the TTL runs out.
+
+    With `spill_dir`, results evicted from memory are written there as Parquet
+    (requires pyarrow) and read back on the next hit until they expire.
+    `invalidate_tables` drops every result that read a given table.
+    """
+
+    def __init__(self, ttl_seconds=300, max_bytes=100_000_000, spill_dir=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def _key(self, connection_key, query, params, fold_identifiers):
+        return (connection_key, normalize_sql(query, fold_identifiers), params)
+
+    def get(self, connection_key, query, params=(), fold_identifiers=True):
+        """
+        Returns (df, total_rows, truncated, cached_at) for this query, or None on a miss.
+        `params` holds anything else that changes the result, e.g. the row cap or the
+        version of the data read. `fold_identifiers` is passed to normalize_sql.
+        """
+        if not self.enabled:
+            return None
+        key = self._key(connection_key, query, params, fold_identifiers)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            df = entry.df
+            spill_path = entry.spill_path
+        if df is None:
+            try:
+                df = pd.read_parquet(spill_path)
+            except Exception as e:
+                print(f"Error reading spilled query result: {e}")
+                with self._lock:
+                    self._remove(key)
+                    self.misses += 1
+                return None
+            with self._lock:
+                if self._entries.get(key) is entry and entry.df is None:
+                    entry.df = df
+                    self._bytes += entry.size
+                    self._evict()
+        with self._lock:
+            self.hits += 1
+        return df, entry.total_rows, entry.truncated, entry.created_at
+
+    def put(self, connection_key, query, df, total_rows, truncated, params=(), fold_identifiers=True):
+        if not self.enabled:
+            return
+        key = self._key(connection_key, query, params, fold_identifiers)
+        # Lowercased regardless of the database, so invalidate_tables matches loosely
+        tables = {table.lower() for table in referenced_tables(query)}
+        entry = _CachedResult(df, total_rows, truncated, tables, self.ttl_seconds)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops expired results, then moves least recently used results out of memory
+        until under max_bytes. Holds the lock.
+        """
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(key)
+        for key, entry in list(self._entries.items()):
+            if self._bytes <= self.max_bytes:
+                break
+            if entry.df is None:
+                continue
+            if self.spill_dir and self._spill(key, entry):
+                entry.df = None
+                self._bytes -= entry.size
+            else:
+                self._remove(key)
+
+    def _spill(self, key, entry):
+        if entry.spill_path is None:
+            name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+            path = os.path.join(self.spill_dir, f"{name}.parquet")
+            try:
+                entry.df.to_parquet(path)
+            except Exception as e:
+                print(f"Error spilling query result to disk: {e}")
+                return False
+            entry.spill_path = path
+        return True
+
+    def _remove(self, key):
+        """Drops one entry from memory and disk. Holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.df is not None:
+            self._bytes -= entry.size
+        if entry.spill_path is not None:
+            try:
+                os.remove(entry.spill_path)
+            except OSError:
+                pass
+
+    def invalidate_tables(self, connection_key, tables):
+        """Drops every cached result of this connection that read one of `tables`."""
+        tables = {table.split('.')[-1].lower() for table in tables}
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if key[0] == connection_key and entry.tables & tables
+            ]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def invalidate(self, connection_key=None):
+        """Drops every result of a connection, or everything."""
+        with self._lock:
+            stale = [key for key in self._entries if connection_key is None or key[0] == connection_key]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            spilled = sum(1 for entry in self._entries.values() if entry.df is None)
+            return {
+                "entries": len(self._entries),
+                "spilled": spilled,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,76 @@
+import threading
+import time
+
+
+class SchemaCache:
+    """
+    Caches schema metadata (table lists, column descriptions) keyed by connection
+    and table, expiring entries after `ttl_seconds`.
+
+    With `fingerprint_interval_seconds` > 0, a cheap catalog fingerprint query
+    is run at most that often; if it changed, every entry of that connection is
+    dropped, so schema changes are picked up before the TTL runs out.
+    """
+
+    def __init__(self, ttl_seconds=600, fingerprint_interval_seconds=0):
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint_interval_seconds = fingerprint_interval_seconds
+        self._entries = {}
+        self._fingerprints = {}  # connection key -> (checked_at, fingerprint)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, connection_key, name, loader, fingerprint=None):
+        """
+        Returns the cached value for (connection_key, name), calling `loader` on a miss.
+        `fingerprint` is an optional callable returning the connection's catalog fingerprint.
+        """
+        if fingerprint is not None:
+            self._check_fingerprint(connection_key, fingerprint)
+
+        key = (connection_key, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+        self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        return value
+
+    def _check_fingerprint(self, connection_key, fingerprint):
+        if self.fingerprint_interval_seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            checked = self._fingerprints.get(connection_key)
+        if checked is not None and now - checked[0] < self.fingerprint_interval_seconds:
+            return
+        try:
+            current = fingerprint()
+        except Exception as e:
+            print(f"Error checking schema fingerprint: {e}")
+            return
+        if checked is not None and checked[1] != current:
+            self.invalidate(connection_key)
+        with self._lock:
+            self._fingerprints[connection_key] = (now, current)
+
+    def invalidate(self, connection_key=None, name=None):
+        """Drops one entry, every entry of a connection, or everything."""
+        with self._lock:
+            if connection_key is None:
+                self._entries.clear()
+                self._fingerprints.clear()
+            elif name is not None:
+                self._entries.pop((connection_key, name), None)
+            else:
+                self._entries = {key: value for key, value in self._entries.items() if key[0] != connection_key}
+                self._fingerprints.pop(connection_key, None)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,14 +1,68 @@
 from .db_connector import DatabaseConnector
+from .schema_cache import SchemaCache
 import pandas as pd
 
 class SchemaInspector:
-    def __init__(self, connector: DatabaseConnector):
+    def __init__(self, connector: DatabaseConnector, cache: SchemaCache = None):
         self.connector = connector
+        self.cache = cache
+
+    def _cached(self, name, loader):
+        if self.cache is None:
+            return loader()
+        return self.cache.get(self.connector.connection_key, name, loader, fingerprint=self.get_schema_fingerprint)
 
     def get_all_tables(self):
         """
         Retrieves a list of all tables in the database.
         """
+        return list(self._cached('tables', self._load_all_tables))
+
+    def get_table_schema(self, table_name):
+        """
+        Retrieves the schema (column name, type) for a specific table.
+        """
+        return self._cached(('table', table_name), lambda: self._load_table_schema(table_name)).copy()
+
+    def refresh(self):
+        """
+        Drops cached schema metadata for this connection so the next lookups hit the database.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(self.connector.connection_key)
+
+    def get_schema_fingerprint(self):
+        """
+        A cheap catalog query whose result changes when tables or columns are added,
+        dropped or retyped. Used to invalidate the schema cache early.
+        """
+        if self.connector.db_type == 'postgresql':
+            query = """
+            SELECT count(*) AS columns,
+                   md5(string_agg(table_name || '.' || column_name || ':' || data_type, ','
+                                  ORDER BY table_name, ordinal_position)) AS digest
+            FROM information_schema.columns
+            WHERE table_schema = 'public'
+            """
+        elif self.connector.db_type == 'mysql':
+            query = """
+            SELECT COUNT(*) AS columns, COUNT(DISTINCT TABLE_NAME) AS tables,
+                   (SELECT MAX(CREATE_TIME) FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = DATABASE()) AS changed
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            """
+        elif self.connector.db_type == 'bigquery':
+            dataset_id = self.connector.config.get('dataset_id')
+            query = f"""
+            SELECT COUNT(*) AS columns, COUNT(DISTINCT table_name) AS tables
+            FROM `{dataset_id}.INFORMATION_SCHEMA.COLUMNS`
+            """
+        else:
+            return None
+        return tuple(self.connector.execute_query(query).iloc[0].astype(str))
+
+    def _load_all_tables(self):
         if self.connector.db_type == 'postgresql':
             query = """
             SELECT table_name 
@@ -31,10 +85,7 @@ class SchemaInspector:
             
         return []
 
-    def get_table_schema(self, table_name):
-        """
-        Retrieves the schema (column name, type) for a specific table.
-        """
+    def _load_table_schema(self, table_name):
         if self.connector.db_type == 'postgresql':
             query = f"""
             SELECT column_name, data_type 
@@ -56,14 +107,118 @@ class SchemaInspector:
             
         return pd.DataFrame()
 
+    def get_all_columns(self):
+        """
+        Retrieves every column of every table in one query, with primary and foreign keys.
+
+        Returns a DataFrame with table_name, column_name, data_type, ordinal_position,
+        is_primary_key, references_table and references_column, ordered by table and position.
+        """
+        return self._cached('columns', self._load_all_columns).copy()
+
+    def _load_all_columns(self):
+        if self.connector.db_type == 'postgresql':
+            query = """
+            SELECT c.table_name, c.column_name, c.data_type, c.ordinal_position,
+                   pk.column_name IS NOT NULL AS is_primary_key,
+                   fk.references_table, fk.references_column
+            FROM information_schema.columns c
+            LEFT JOIN (
+                SELECT kcu.table_name, kcu.column_name
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage kcu
+                  ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+                 AND kcu.table_name = tc.table_name
+                WHERE tc.constraint_type = 'PRIMARY KEY' AND tc.table_schema = 'public'
+            ) pk ON pk.table_name = c.table_name AND pk.column_name = c.column_name
+            LEFT JOIN (
+                -- pg_constraint pairs each FK column with its referenced column by position;
+                -- constraint names are only unique per table, so information_schema can't
+                SELECT cl.relname AS table_name, a.attname AS column_name,
+                       rcl.relname AS references_table, ra.attname AS references_column
+                FROM pg_constraint con
+                JOIN pg_class cl ON cl.oid = con.conrelid
+                JOIN pg_namespace ns ON ns.oid = cl.relnamespace
+                JOIN pg_class rcl ON rcl.oid = con.confrelid
+                CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(attnum, references_attnum)
+                JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = k.references_attnum
+                WHERE con.contype = 'f' AND ns.nspname = 'public'
+            ) fk ON fk.table_name = c.table_name AND fk.column_name = c.column_name
+            WHERE c.table_schema = 'public'
+            ORDER BY c.table_name, c.ordinal_position
+            """
+        elif self.connector.db_type == 'mysql':
+            query = """
+            SELECT c.TABLE_NAME AS table_name, c.COLUMN_NAME AS column_name, c.DATA_TYPE AS data_type,
+                   c.ORDINAL_POSITION AS ordinal_position, c.COLUMN_KEY = 'PRI' AS is_primary_key,
+                   k.REFERENCED_TABLE_NAME AS references_table, k.REFERENCED_COLUMN_NAME AS references_column
+            FROM information_schema.COLUMNS c
+            LEFT JOIN information_schema.KEY_COLUMN_USAGE k
+              ON k.TABLE_SCHEMA = c.TABLE_SCHEMA AND k.TABLE_NAME = c.TABLE_NAME
+             AND k.COLUMN_NAME = c.COLUMN_NAME AND k.REFERENCED_TABLE_NAME IS NOT NULL
+            WHERE c.TABLE_SCHEMA = DATABASE()
+            ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+            """
+        elif self.connector.db_type == 'bigquery':
+            dataset_id = self.connector.config.get('dataset_id')
+            query = f"""
+            SELECT c.table_name, c.column_name, c.data_type, c.ordinal_position,
+                   pk.column_name IS NOT NULL AS is_primary_key,
+                   fk.references_table, fk.references_column
+            FROM `{dataset_id}.INFORMATION_SCHEMA.COLUMNS` c
+            LEFT JOIN (
+                SELECT k.table_name, k.column_name
+                FROM `{dataset_id}.INFORMATION_SCHEMA.TABLE_CONSTRAINTS` t
+                JOIN `{dataset_id}.INFORMATION_SCHEMA.KEY_COLUMN_USAGE` k
+                  ON k.constraint_name = t.constraint_name AND k.table_name = t.table_name
+                WHERE t.constraint_type = 'PRIMARY KEY'
+            ) pk ON pk.table_name = c.table_name AND pk.column_name = c.column_name
+            LEFT JOIN (
+                -- BigQuery foreign keys reference the primary key, so each FK column is
+                -- paired with the PK column at its position_in_unique_constraint
+                SELECT k.table_name, k.column_name,
+                       rk.table_name AS references_table, rk.column_name AS references_column
+                FROM `{dataset_id}.INFORMATION_SCHEMA.TABLE_CONSTRAINTS` t
+                JOIN `{dataset_id}.INFORMATION_SCHEMA.KEY_COLUMN_USAGE` k
+                  ON k.constraint_name = t.constraint_name AND k.table_name = t.table_name
+                JOIN (
+                    SELECT DISTINCT constraint_name, table_name
+                    FROM `{dataset_id}.INFORMATION_SCHEMA.CONSTRAINT_COLUMN_USAGE`
+                ) u ON u.constraint_name = t.constraint_name
+                JOIN `{dataset_id}.INFORMATION_SCHEMA.TABLE_CONSTRAINTS` rt
+                  ON rt.table_name = u.table_name AND rt.constraint_type = 'PRIMARY KEY'
+                JOIN `{dataset_id}.INFORMATION_SCHEMA.KEY_COLUMN_USAGE` rk
+                  ON rk.constraint_name = rt.constraint_name AND rk.table_name = rt.table_name
+                 AND rk.ordinal_position = k.position_in_unique_constraint
+                WHERE t.constraint_type = 'FOREIGN KEY'
+            ) fk ON fk.table_name = c.table_name AND fk.column_name = c.column_name
+            ORDER BY c.table_name, c.ordinal_position
+            """
+        else:
+            return pd.DataFrame(columns=[
+                'table_name', 'column_name', 'data_type', 'ordinal_position',
+                'is_primary_key', 'references_table', 'references_column',
+            ])
+        columns = self.connector.execute_query(query)
+        columns['is_primary_key'] = columns['is_primary_key'].fillna(False).astype(bool)
+        return columns
+
     def get_formatted_schema(self):
         """
         Returns a string representation of the schema for all tables, formatted for the LLM.
         """
-        tables = self.get_all_tables()
-        schema_str = ""
-        for table in tables:
-            df = self.get_table_schema(table)
-            columns = [f"{row['column_name']} ({row['data_type']})" for _, row in df.iterrows()]
-            schema_str += f"Table: {table}\nColumns: {', '.join(columns)}\n\n"
-        return schema_str
+        columns = self.get_all_columns()
+        if columns.empty:
+            return ""
+        # Built with column-wise string operations instead of a Python loop over rows
+        foreign_keys = (
+            " -> " + columns['references_table'].astype(str) + "." + columns['references_column'].astype(str)
+        ).where(columns['references_table'].notna(), "")
+        described = (
+            columns['column_name'].astype(str) + " (" + columns['data_type'].astype(str) + ")"
+            + columns['is_primary_key'].map({True: " PK", False: ""})
+            + foreign_keys
+        )
+        per_table = described.groupby(columns['table_name'], sort=True).agg(", ".join)
+        return "".join("Table: " + per_table.index + "\nColumns: " + per_table.values + "\n\n")
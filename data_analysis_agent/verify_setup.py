@@ -18,7 +18,7 @@ def verify():
         return
 
     # 2. Test Tool Registration
-    expected_tools = ['list_tables', 'get_schema', 'execute_sql']
+    expected_tools = ['list_tables', 'get_schema', 'describe_database', 'refresh_schema', 'execute_sql', 'clear_query_cache']
     agent_tools = [tool.__name__ for tool in agent.tools]
     
     missing_tools = [tool for tool in expected_tools if tool not in agent_tools]